@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Benchmark of what the qtile config costs: load time, screen setup, hot-plug latency,
+forks and wakeups of the custom widgets and hooks while idle.
+
+Everything runs against a headless Xvfb with 'xrandr' replaced by a stand-in which
+prints fixtures/xrandr_query.txt and logs its calls, HOME is a temporary directory
+with .config/qtile pointing to the config dir, so the real session is not touched.
+
+Phases:
+    load  - config.py is imported in a fresh interpreter (cold) and reloaded several
+            times the way qtile's Config.load does it on mod+ctrl+r (every module of
+            the config dir is reloaded, then config.py), setup_screens(),
+            configure_monitors() and on_screen_change are timed, subprocesses are
+            counted by an audit hook
+    idle  - 'qtile start' runs the config for --duration seconds after --warmup,
+            wakeups are voluntary + involuntary context switches of qtile process,
+            forks are logged by the same audit hook
+
+The report is JSON with sorted keys, so reports of two commits or of the laptop and
+desktop trees can be compared with diff.
+
+With --budget-ms the harness exits with code 1 if the median config reload is slower,
+e.g. '--budget-ms 100 --no-idle' is a quick check of a change.
+
+Usage: python3 benchmarks/config_harness.py [config dir] [-o report.json] [--budget-ms 100]
+By default the desktop config is used.
+
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+FIXTURES_DIR = Path(BENCHMARKS_DIR, "fixtures")
+DEFAULT_CONFIG_DIR = Path(
+    BENCHMARKS_DIR.parent, "desktops/intel_nvidia/home/dotfiles/.config/qtile"
+)
+
+# Audit events of starting a new process
+SPAWN_EVENTS = {"subprocess.Popen", "os.posix_spawn", "os.fork", "os.system", "os.exec"}
+
+XRANDR_STAND_IN = """#!/bin/sh
+echo "$@" >> "{log}"
+case "$1" in
+    ""|-q|--query|--current) cat "{fixture}" ;;
+esac
+"""
+
+
+# Probes, they run in the subprocesses with the benchmark environment
+
+
+def process_name(event, args) -> str:
+    if event == "subprocess.Popen":
+        executable, argv = args[0], args[1]
+        if executable is None:
+            executable = argv if isinstance(argv, (str, bytes)) else argv[0]
+        return os.path.basename(os.fsdecode(executable)).split()[0]
+    if event in ("os.posix_spawn", "os.exec"):
+        return os.path.basename(os.fsdecode(args[0]))
+    if event == "os.system":
+        return os.fsdecode(args[0]).split()[0]
+    return "fork"
+
+
+def install_spawn_counter(log_path=None) -> Counter:
+    """Counting started processes by executable, optionally logging them with time"""
+
+    spawns = Counter()
+    log = open(log_path, "a", buffering=1) if log_path else None
+
+    def hook(event, args):
+        if event not in SPAWN_EVENTS:
+            return
+        name = process_name(event, args)
+        spawns[name] += 1
+        if log:
+            log.write(f"{time.monotonic()} {name}\n")
+
+    sys.addaudithook(hook)
+    return spawns
+
+
+def timed(func, spawns, *args) -> tuple[dict, object]:
+    """Calling func, returns its time and started processes"""
+
+    before = spawns.copy()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    return {"ms": round(elapsed * 1000, 3), "forks": dict(spawns - before)}, result
+
+
+def load_config(config_file) -> dict:
+    """The first load, qtile imports config.py as a module"""
+
+    return vars(importlib.import_module(config_file.stem))
+
+
+def reload_config(config_file) -> dict:
+    """The same as qtile's Config.load with _reload_config_submodules()"""
+
+    for module in sys.modules.copy().values():
+        path = getattr(module, "__file__", None)
+        if path is None or Path(path) == config_file:
+            continue
+        if config_file.parent in Path(path).parents:
+            importlib.reload(module)
+    return vars(importlib.reload(sys.modules[config_file.stem]))
+
+
+def probe_load(config_dir, reloads) -> dict:
+    """Timing config load and the screen functions"""
+
+    spawns = install_spawn_counter()
+    config_file = Path(config_dir, "config.py")
+    sys.path.insert(0, str(config_dir))
+
+    cold, namespace = timed(load_config, spawns, config_file)
+    reload_times = []
+    reload_forks = Counter()
+    for _ in range(reloads):
+        result, namespace = timed(reload_config, spawns, config_file)
+        reload_times.append(result["ms"])
+        reload_forks.update(result["forks"])
+
+    from custom_utils import screens
+
+    report = {
+        "load": {
+            "cold": cold,
+            "reload": {
+                "min_ms": min(reload_times),
+                "median_ms": statistics.median(reload_times),
+                "max_ms": max(reload_times),
+                "forks_per_reload": {k: v / reloads for k, v in reload_forks.items()},
+            },
+        },
+        "calls": {},
+    }
+    for name in ("setup_screens", "configure_monitors", "monitor_layout_command"):
+        if hasattr(screens, name):
+            report["calls"][name], _ = timed(getattr(screens, name), spawns)
+
+    if "on_screen_change" in namespace:
+        report["screen_change"] = asyncio.run(probe_screen_change(namespace, spawns))
+    return report
+
+
+async def probe_screen_change(namespace, spawns) -> dict:
+    """Latency from screen_change event to reconfiguring screens"""
+
+    reconfigured = asyncio.get_running_loop().create_future()
+    handler = namespace.get("screen_change_handler")
+    if handler is None:
+        # Synchronous handler, there is no running qtile for its reconfiguration
+        try:
+            result, _ = timed(namespace["on_screen_change"], spawns, None)
+        except Exception as e:
+            return {"latency_ms": None, "error": str(e)}
+        return {"latency_ms": result["ms"], "debounce_ms": 0, "forks": result["forks"]}
+    handler.reconfigure = lambda: reconfigured.done() or reconfigured.set_result(True)
+
+    before = spawns.copy()
+    start = time.perf_counter()
+    namespace["on_screen_change"](None)
+    try:
+        await asyncio.wait_for(reconfigured, 10)
+        latency = round((time.perf_counter() - start) * 1000, 3)
+    except asyncio.TimeoutError:
+        latency = None
+    return {
+        "latency_ms": latency,
+        "debounce_ms": handler.debounce * 1000,
+        "forks": dict(spawns - before),
+    }
+
+
+def probe_qtile(config_dir, spawn_log):
+    """Running qtile with the config, started processes are logged"""
+
+    install_spawn_counter(spawn_log)
+    from libqtile.scripts.main import main
+
+    sys.argv = ["qtile", "start", "-c", str(Path(config_dir, "config.py"))]
+    main()
+
+
+# Harness
+
+
+class Environment:
+    """Xvfb, xrandr stand-in and temporary HOME"""
+
+    def __init__(self, config_dir, fixture, screen):
+        self.tmp = tempfile.TemporaryDirectory(prefix="qtile-bench-")
+        tmp = Path(self.tmp.name)
+        home = Path(tmp, "home")
+        Path(home, ".config").mkdir(parents=True)
+        Path(home, ".config/qtile").symlink_to(Path(config_dir).resolve())
+
+        bin_dir = Path(tmp, "bin")
+        bin_dir.mkdir()
+        self.xrandr_log = Path(tmp, "xrandr.log")
+        self.xrandr_log.touch()
+        xrandr = Path(bin_dir, "xrandr")
+        xrandr.write_text(XRANDR_STAND_IN.format(log=self.xrandr_log, fixture=Path(fixture).resolve()))
+        xrandr.chmod(0o755)
+
+        read_fd, write_fd = os.pipe()
+        self.xvfb = subprocess.Popen(
+            ["Xvfb", "-displayfd", str(write_fd), "-screen", "0", screen, "-nolisten", "tcp"],
+            pass_fds=(write_fd,),
+            stderr=subprocess.DEVNULL,
+        )
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            display = f.readline().strip()
+        if not display:
+            raise RuntimeError("Xvfb has not started")
+
+        self.env = {
+            **os.environ,
+            "DISPLAY": f":{display}",
+            "HOME": str(home),
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+        }
+        self.env.pop("WAYLAND_DISPLAY", None)
+
+    def xrandr_calls(self) -> int:
+        return len(self.xrandr_log.read_text().splitlines())
+
+    def close(self):
+        self.xvfb.terminate()
+        self.xvfb.wait()
+        self.tmp.cleanup()
+
+
+def run_load(environment, config_dir, reloads) -> dict:
+    xrandr_calls = environment.xrandr_calls()
+    result = subprocess.run(
+        [sys.executable, __file__, "--probe", "load", "--reloads", str(reloads), str(config_dir)],
+        env=environment.env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(result.stdout.splitlines()[-1])
+    report["load"]["xrandr_calls"] = environment.xrandr_calls() - xrandr_calls
+    return report
+
+
+def context_switches(pid) -> int:
+    """Voluntary and involuntary context switches, every wakeup is one of them"""
+
+    switches = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches")):
+                switches += int(line.split()[1])
+    return switches
+
+
+def run_idle(environment, config_dir, warmup, duration) -> dict:
+    spawn_log = Path(environment.tmp.name, "spawns.log")
+    spawn_log.touch()
+    qtile = subprocess.Popen(
+        [sys.executable, __file__, "--probe", "qtile", "--spawn-log", str(spawn_log), str(config_dir)],
+        env=environment.env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    try:
+        time.sleep(warmup)
+        if qtile.poll() is not None:
+            raise RuntimeError(f"qtile exited with code {qtile.returncode}")
+
+        xrandr_calls = environment.xrandr_calls()
+        switches = context_switches(qtile.pid)
+        start = time.monotonic()
+        time.sleep(duration)
+        end = time.monotonic()
+        switches = context_switches(qtile.pid) - switches
+        xrandr_calls = environment.xrandr_calls() - xrandr_calls
+    finally:
+        # Autostarted programs are in the same session
+        os.killpg(qtile.pid, signal.SIGTERM)
+        qtile.wait()
+
+    forks = Counter()
+    for line in spawn_log.read_text().splitlines():
+        timestamp, name = line.split(" ", 1)
+        if start <= float(timestamp) <= end:
+            forks[name] += 1
+    elapsed = end - start
+    return {
+        "duration_s": round(elapsed, 3),
+        "wakeups_per_second": round(switches / elapsed, 2),
+        "forks_per_minute": round(sum(forks.values()) / elapsed * 60, 2),
+        "forks": dict(forks),
+        "xrandr_calls": xrandr_calls,
+    }
+
+
+def git_revision(path) -> str | None:
+    result = subprocess.run(
+        ["git", "-C", str(path), "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    )
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of qtile config")
+    parser.add_argument("config_dir", nargs="?", type=Path, default=DEFAULT_CONFIG_DIR)
+    parser.add_argument("-o", "--output", type=Path, help="write the report to the file instead of stdout")
+    parser.add_argument("--reloads", type=int, default=10, help="number of config reloads (default: 10)")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds before measuring idle qtile (default: 5)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of measuring idle qtile (default: 60)")
+    parser.add_argument("--no-idle", action="store_true", help="skip running qtile")
+    parser.add_argument("--budget-ms", type=float, help="fail if the median config reload is slower")
+    parser.add_argument("--fixture", type=Path, default=Path(FIXTURES_DIR, "xrandr_query.txt"))
+    parser.add_argument("--screen", default="1920x1080x24", help="Xvfb screen (default: 1920x1080x24)")
+    parser.add_argument("--probe", choices=("load", "qtile"), help=argparse.SUPPRESS)
+    parser.add_argument("--spawn-log", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe == "load":
+        print(json.dumps(probe_load(args.config_dir, args.reloads)))
+        return
+    if args.probe == "qtile":
+        probe_qtile(args.config_dir, args.spawn_log)
+        return
+
+    config_dir = args.config_dir.resolve()
+    environment = Environment(config_dir, args.fixture, args.screen)
+    try:
+        report = {
+            "config_dir": os.path.relpath(config_dir, BENCHMARKS_DIR.parent),
+            "revision": git_revision(BENCHMARKS_DIR.parent),
+            "python": platform.python_version(),
+            **run_load(environment, config_dir, args.reloads),
+        }
+        if not args.no_idle:
+            report["idle"] = run_idle(environment, config_dir, args.warmup, args.duration)
+    finally:
+        environment.close()
+
+    output = json.dumps(report, indent=4, sort_keys=True)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+    reload_ms = report["load"]["reload"]["median_ms"]
+    if args.budget_ms is not None and reload_ms > args.budget_ms:
+        sys.exit(f"Config reload takes {reload_ms} ms, the budget is {args.budget_ms} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the RDP connection index on a generated config with 5000 hosts.
+
+It compares the old way of building the menu (parse the JSON, sort names, find the
+pick by a linear scan) with custom_utils.rdp_index: the menu of the first launch
+(parse and write the cache), of next launches (read the cache, rank by usage) and
+the lookup of the pick.
+
+Usage: python3 benchmarks/rdp_index.py [path to qtile config dir] [number of hosts]
+By default the desktop config is used.
+
+"""
+
+import json
+import random
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+DEFAULT_CONFIG_DIR = Path(
+    BENCHMARKS_DIR.parent, "desktops/intel_nvidia/home/dotfiles/.config/qtile"
+)
+
+
+def generate_config(path, hosts):
+    rng = random.Random(0)
+    connections = [
+        {
+            "connection_name": f"project{i % 50:02d}-vm{i:05d}",
+            "username": f"user{i % 7}",
+            "password": None,
+            "ip_address": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            "params": "-grab-keyboard /dynamic-resolution /cert:ignore",
+        }
+        for i in rng.sample(range(hosts), hosts)
+    ]
+    path.write_text(json.dumps(connections, indent=4))
+    return [c["connection_name"] for c in connections]
+
+
+def old_select(config_file, pick) -> dict | None:
+    """Menu building and lookup which were used before custom_utils.rdp_index"""
+
+    with open(config_file) as f:
+        connections = json.load(f)
+    names = sorted([c["connection_name"] for c in connections])
+    names.append("Connect to...")
+    return next(c for c in connections if c["connection_name"] == pick)
+
+
+def bench(func, number) -> float:
+    """Returns milliseconds per call"""
+
+    return timeit.timeit(func, number=number) / number * 1000
+
+
+def main():
+    config_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CONFIG_DIR
+    hosts = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    sys.path.insert(0, str(config_dir))
+    from custom_utils.rdp_index import ConnectionIndex
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_file = Path(tmp, "rdp_connector.json")
+        cache_dir = Path(tmp, "cache")
+        names = generate_config(config_file, hosts)
+        pick = names[-1]
+        for name in names[:20]:
+            ConnectionIndex(config_file, cache_dir).record_use(name)
+
+        def cold():
+            Path(cache_dir, "index.pickle").unlink(missing_ok=True)
+            return ConnectionIndex(config_file, cache_dir).ranked()
+
+        def warm():
+            # A new launch of the menu reads the cache
+            return ConnectionIndex(config_file, cache_dir).ranked()
+
+        def pick_after_menu():
+            index = ConnectionIndex(config_file, cache_dir)
+            index.ranked()
+            return index.get(pick)
+
+        assert old_select(config_file, pick) == pick_after_menu()
+        assert warm()[0] == names[19], "recently used host is not the first"
+        cold()
+
+        number = 20
+        old_time = bench(lambda: old_select(config_file, pick), number)
+        warm_time = bench(warm, number)
+        print(f"{hosts} hosts, ms per launch")
+        print(f"{'old: parse, sort, scan':<36}{old_time:>10.2f}")
+        print(f"{'index: menu, first launch':<36}{bench(cold, number):>10.2f}")
+        print(f"{'index: menu, next launches':<36}{warm_time:>10.2f}{old_time / warm_time:>9.1f}x")
+        print(f"{'index: menu and the pick':<36}{bench(pick_after_menu, number):>10.2f}")
+
+        index = ConnectionIndex(config_file, cache_dir)
+        connections = list(index.connections().values())
+        old_lookup = bench(lambda: next(c for c in connections if c["connection_name"] == pick), 100)
+        print(f"{'old: lookup by scan':<36}{old_lookup:>10.4f}")
+        print(f"{'index: lookup by name':<36}{bench(lambda: index.get(pick), 10_000):>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
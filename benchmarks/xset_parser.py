@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of parsing 'xset -q' and 'setxkbmap -query' outputs.
+
+It compares the old parser (decode, split lines, scan) with custom_utils.xset_parser
+on the outputs recorded in fixtures/ and prints the cost of one poll.
+
+Usage: python3 benchmarks/xset_parser.py [path to qtile config dir]
+By default the desktop config is used.
+
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+FIXTURES_DIR = Path(BENCHMARKS_DIR, "fixtures")
+DEFAULT_CONFIG_DIR = Path(
+    BENCHMARKS_DIR.parent, "desktops/intel_nvidia/home/dotfiles/.config/qtile"
+)
+
+
+def old_parse_led_mask(output: bytes) -> int | None:
+    """Parser which was used before custom_utils.xset_parser"""
+
+    for line in output.decode().split('\n'):
+        if 'LED mask' in line:
+            mask_str = line.split('LED mask:')[1].strip()
+            return int(mask_str.replace(' ', ''), 16)
+    return None
+
+
+def old_parse_layouts(output: bytes) -> list[str] | None:
+    """Parser which was used before custom_utils.xset_parser"""
+
+    for line in output.decode().split("\n"):
+        if line.startswith('layout:'):
+            return line.split(':')[1].strip().split(',')
+    return None
+
+
+def bench(func, output, number) -> float:
+    """Returns microseconds per call"""
+
+    return timeit.timeit(lambda: func(output), number=number) / number * 1e6
+
+
+def main():
+    config_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CONFIG_DIR
+    sys.path.insert(0, str(config_dir))
+    from custom_utils.xset_parser import parse_layouts, parse_led_mask
+
+    cases = [
+        ("xset_q_group1.txt", 0x00000000, old_parse_led_mask, parse_led_mask),
+        ("xset_q_group2.txt", 0x00001002, old_parse_led_mask, parse_led_mask),
+        ("setxkbmap_query.txt", ["us", "ru"], old_parse_layouts, parse_layouts),
+    ]
+    number = 100_000
+
+    print(f"{'fixture':<24}{'old, us':>12}{'new, us':>12}{'speedup':>10}")
+    for name, expected, old, new in cases:
+        output = Path(FIXTURES_DIR, name).read_bytes()
+        assert old(output) == expected, f"old parser failed on {name}"
+        assert new(output) == expected, f"new parser failed on {name}"
+
+        old_time = bench(old, output, number)
+        new_time = bench(new, output, number)
+        print(f"{name:<24}{old_time:>12.2f}{new_time:>12.2f}{old_time / new_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Building bars from a declarative spec.
+
+The spec is a list of WidgetSpec: a widget class, its config, screens it is shown
+on ("all", "primary" or "secondary") and per-screen overrides of the config.
+
+A shared widget is created once and the same instance is put on every bar; qtile
+makes mirrors of it on the other bars (they repaint the widget's drawer, redraws of
+the bars are coalesced by qtile), so there is one poller (one sysfs read, one amixer
+call) no matter how many monitors are plugged. A shared widget has one config for
+all the screens, so it cannot have overrides.
+
+"""
+
+from typing import Callable, NamedTuple
+
+from libqtile import bar
+
+
+class WidgetSpec(NamedTuple):
+    factory: Callable
+    config: dict = {}
+    # "all", "primary" or "secondary"
+    screens: str = "all"
+    # One instance for all the bars
+    shared: bool = False
+    # Config overrides by screen role, e.g. {"secondary": {"fontsize": 12}}
+    overrides: dict = {}
+
+
+class BarBuilder:
+    """Creating bars for primary and secondary screens from one spec"""
+
+    def __init__(self, spec, size=24):
+        for widget_spec in spec:
+            if widget_spec.shared and widget_spec.overrides:
+                raise ValueError(f"Shared widget {widget_spec.factory.__name__} cannot have overrides")
+        self.spec = spec
+        self.size = size
+        self.shared = {}
+
+    def build(self, role) -> bar.Bar:
+        """Creating bar for the screen role: "primary" or "secondary" """
+
+        widgets = []
+        for i, widget_spec in enumerate(self.spec):
+            if widget_spec.screens not in ("all", role):
+                continue
+            if widget_spec.shared:
+                if i not in self.shared:
+                    self.shared[i] = widget_spec.factory(**widget_spec.config)
+                widgets.append(self.shared[i])
+            else:
+                config = {**widget_spec.config, **widget_spec.overrides.get(role, {})}
+                widgets.append(widget_spec.factory(**config))
+        return bar.Bar(widgets, self.size)
+
+    def reset(self):
+        """Forgetting shared widgets, the next bars will get new instances"""
+
+        self.shared.clear()
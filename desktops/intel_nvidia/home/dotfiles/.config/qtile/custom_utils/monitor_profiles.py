@@ -0,0 +1,320 @@
+"""
+Autorandr-like monitor profiles.
+
+Profiles are read from ~/.config/qtile/monitor_profiles.json, for example:
+
+[
+    {
+        "name": "home",
+        "outputs": {
+            "eDP-1": {"mode": "1920x1200", "pos": "0x0", "primary": true},
+            "5c1f8e0d2b7a9c41": {"mode": "2560x1440", "pos": "1920x0", "rate": 75},
+            "HDMI-2": {"off": true}
+        }
+    }
+]
+
+Keys of "outputs" are output names or EDID fingerprints of monitors (so the same
+monitor matches on any port). A profile is used when every connected output matches
+one of its keys and vice versa. Options of an output: "mode" (otherwise --auto),
+"pos" ("<width>x<height>" and "<x>x<y>"), "right-of" (a key of another output of
+the profile), "rate" and "scale" (numbers), "rotate" (normal, left, right, inverted),
+"primary", "off" (true or false). Invalid profiles are reported in qtile's log and
+skipped.
+
+Run 'python3 -m custom_utils.monitor_profiles' from the qtile config dir to print
+fingerprints of connected monitors and the profile for the current layout.
+
+If no profile matches, the default one is used: a single monitor gets its preferred
+mode, with two or more monitors the external one is placed right of the laptop's one
+and other monitors are left as they are.
+
+All the outputs are set in one xrandr call and nothing is applied if the current
+layout already matches the profile.
+
+"""
+
+import json
+import re
+from pathlib import Path
+
+from libqtile.log_utils import logger
+
+PROFILES_FILE = Path(Path.home(), ".config/qtile/monitor_profiles.json")
+
+OUTPUT_OPTIONS = {"mode", "pos", "right-of", "rate", "rotate", "scale", "primary", "off"}
+ROTATIONS = ("normal", "left", "right", "inverted")
+SIZE_PATTERN = re.compile(r"\d+x\d+")
+
+_profiles_cache = (None, [])
+
+
+def check_profile(profile):
+    """Raising ValueError with a readable message if the profile is invalid"""
+
+    if not isinstance(profile, dict) or not isinstance(profile.get("outputs"), dict):
+        raise ValueError("a profile must be an object with 'outputs' object")
+    outputs = profile["outputs"]
+    for key, setup in outputs.items():
+        if not isinstance(setup, dict):
+            raise ValueError(f"output '{key}' must be an object")
+        unknown = set(setup) - OUTPUT_OPTIONS
+        if unknown:
+            raise ValueError(f"output '{key}' has unknown options {', '.join(sorted(unknown))}")
+        _check_values(key, setup)
+
+        # right-of chain must end at an output placed by its position
+        seen = {key}
+        while "right-of" in setup:
+            other = setup["right-of"]
+            if other not in outputs:
+                raise ValueError(f"output '{key}' is right of unknown output '{other}'")
+            if outputs[other].get("off"):
+                raise ValueError(f"output '{key}' is right of output '{other}' which is off")
+            if other in seen:
+                raise ValueError(f"output '{key}' has a loop of right-of")
+            seen.add(other)
+            setup = outputs[other]
+
+
+def _check_values(key, setup):
+    for option in ("mode", "pos"):
+        if option in setup and not (
+            isinstance(setup[option], str) and SIZE_PATTERN.fullmatch(setup[option])
+        ):
+            raise ValueError(f"output '{key}' has {option} {setup[option]!r}, not like '1920x1080'")
+    for option in ("rate", "scale"):
+        value = setup.get(option, 1)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            raise ValueError(f"output '{key}' has {option} {value!r}, not a positive number")
+    if setup.get("rotate", "normal") not in ROTATIONS:
+        raise ValueError(f"output '{key}' has rotate {setup['rotate']!r}, not one of {', '.join(ROTATIONS)}")
+    for option in ("primary", "off"):
+        if not isinstance(setup.get(option, False), bool):
+            raise ValueError(f"output '{key}' has {option} {setup[option]!r}, not true or false")
+    if "right-of" in setup and not isinstance(setup["right-of"], str):
+        raise ValueError(f"output '{key}' has right-of {setup['right-of']!r}, not an output")
+
+
+def load_profiles(path=PROFILES_FILE) -> list[dict]:
+    """Reading profiles, the file is re-read only if it was changed"""
+
+    global _profiles_cache
+
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return []
+    if _profiles_cache[0] == mtime:
+        return _profiles_cache[1]
+
+    try:
+        with open(path) as f:
+            profiles = json.load(f)
+        if not isinstance(profiles, list):
+            raise ValueError("profiles must be a list")
+    except (OSError, ValueError) as e:
+        logger.error(f"Reading monitor profiles error: {e}")
+        profiles = []
+
+    valid = []
+    for i, profile in enumerate(profiles):
+        try:
+            check_profile(profile)
+        except ValueError as e:
+            name = profile.get("name", i) if isinstance(profile, dict) else i
+            logger.error(f"Monitor profile '{name}' in {path} is skipped: {e}")
+            continue
+        valid.append(profile)
+    _profiles_cache = (mtime, valid)
+    return valid
+
+
+def _match(profile, connected) -> dict | None:
+    """Mapping {output name: setup} if the profile matches connected outputs"""
+
+    keys = set(profile.get("outputs", {}))
+    names = {}
+    for output in connected:
+        key = output.fingerprint if output.fingerprint in keys else output.name
+        if key not in keys:
+            return None
+        keys.discard(key)
+        names[key] = output.name
+    # Keys of not connected outputs are allowed only to turn them off
+    if any(not profile["outputs"][key].get("off") for key in keys):
+        return None
+
+    setups = {}
+    for key, name in names.items():
+        setup = profile["outputs"][key]
+        if "right-of" in setup:
+            # xrandr needs the name of the output, the profile may have its fingerprint
+            setup = {**setup, "right-of": names[setup["right-of"]]}
+        setups[name] = setup
+    return setups
+
+
+def default_setups(connected) -> dict:
+    """
+    The default layout: laptop's monitor is primary, the external one is right of it,
+    the others are not in the setups, so they are left as they are
+    """
+
+    if len(connected) == 1:
+        return {connected[0].name: {"primary": True}}
+
+    laptop = next((o for o in connected if "eDP" in o.name or "LVDS" in o.name), connected[0])
+    external = next(o for o in connected if o is not laptop)
+    return {
+        laptop.name: {"primary": True, "pos": "0x0"},
+        external.name: {"right-of": laptop.name},
+    }
+
+
+def select_setups(outputs) -> tuple[str, dict]:
+    """Finding profile for connected outputs, returns (profile name, setups)"""
+
+    connected = [output for output in outputs if output.connected]
+    if not connected:
+        return "none", {}
+    for profile in load_profiles():
+        setups = _match(profile, connected)
+        if setups is not None:
+            return profile.get("name", "unnamed"), setups
+    return "default", default_setups(connected)
+
+
+def _parse_size(value) -> tuple[int, int]:
+    width, height = value.split("x")
+    return int(width), int(height)
+
+
+def expected_geometry(outputs, name, setups) -> tuple[int, int, int, int] | None:
+    """(x, y, width, height) the output will have after applying setups"""
+
+    by_name = {output.name: output for output in outputs}
+    setup = setups[name]
+    size = _parse_size(setup["mode"]) if "mode" in setup else by_name[name].preferred
+    if size is None:
+        return None
+
+    width, height = size
+    if setup.get("rotate") in ("left", "right"):
+        width, height = height, width
+    scale = setup.get("scale", 1)
+    width, height = round(width * scale), round(height * scale)
+
+    if "right-of" in setup:
+        if setup["right-of"] not in setups:
+            return None
+        other = expected_geometry(outputs, setup["right-of"], setups)
+        if other is None:
+            return None
+        x, y = other[0] + other[2], other[1]
+    else:
+        x, y = _parse_size(setup.get("pos", "0x0"))
+    return x, y, width, height
+
+
+def layout_matches(outputs, setups) -> bool:
+    """Checking if the current layout is the same as the setups"""
+
+    for output in outputs:
+        setup = setups.get(output.name)
+        if setup is None and output.connected:
+            # Not managed by the setups
+            continue
+        if setup is None or setup.get("off"):
+            if output.enabled:
+                return False
+            continue
+
+        geometry = expected_geometry(outputs, output.name, setups)
+        if geometry is None or geometry != (output.x, output.y, output.width, output.height):
+            return False
+        if output.rotation != setup.get("rotate", "normal"):
+            return False
+        if "primary" in setup and output.primary != setup["primary"]:
+            return False
+        if "rate" in setup and (output.rate is None or abs(output.rate - setup["rate"]) > 0.5):
+            return False
+    return True
+
+
+def xrandr_command(outputs, setups) -> list[str]:
+    """One xrandr call setting all the outputs, connected outputs without setups are not changed"""
+
+    command = ["xrandr"]
+    for output in outputs:
+        setup = setups.get(output.name)
+        if setup is None and output.connected:
+            continue
+        if setup is None or setup.get("off"):
+            if output.enabled or output.connected:
+                command += ["--output", output.name, "--off"]
+            continue
+
+        command += ["--output", output.name]
+        command += ["--mode", setup["mode"]] if "mode" in setup else ["--auto"]
+        if "rate" in setup:
+            command += ["--rate", str(setup["rate"])]
+        if "right-of" in setup:
+            command += ["--right-of", setup["right-of"]]
+        else:
+            command += ["--pos", setup.get("pos", "0x0")]
+        command += ["--rotate", setup.get("rotate", "normal")]
+        if "scale" in setup:
+            scale = setup["scale"]
+            command += ["--scale", f"{scale}x{scale}"]
+        if setup.get("primary"):
+            command += ["--primary"]
+    return command
+
+
+def layout_command(outputs) -> list[str] | None:
+    """xrandr command for the matching profile or None if nothing should be changed"""
+
+    name, setups = select_setups(outputs)
+    if not setups:
+        return None
+    if layout_matches(outputs, setups):
+        logger.info(f"Monitor profile '{name}' is already applied")
+        return None
+    logger.info(f"Applying monitor profile '{name}'")
+    return xrandr_command(outputs, setups)
+
+
+def current_profile(outputs) -> dict:
+    """Profile describing the current layout, keyed by EDID fingerprints"""
+
+    profile_outputs = {}
+    for output in outputs:
+        if not output.connected:
+            continue
+        key = output.fingerprint or output.name
+        if not output.enabled:
+            profile_outputs[key] = {"off": True}
+            continue
+        width, height = output.width, output.height
+        if output.rotation in ("left", "right"):
+            width, height = height, width
+        setup = {"mode": f"{width}x{height}", "pos": f"{output.x}x{output.y}"}
+        if output.rate:
+            setup["rate"] = round(output.rate, 2)
+        if output.rotation != "normal":
+            setup["rotate"] = output.rotation
+        if output.primary:
+            setup["primary"] = True
+        profile_outputs[key] = setup
+    return {"name": "current", "outputs": profile_outputs}
+
+
+if __name__ == "__main__":
+    from custom_utils import monitors
+
+    outputs = monitors.get_outputs()
+    for output in outputs:
+        if output.connected:
+            print(f"{output.name}: {output.fingerprint or 'no EDID'}")
+    print(json.dumps(current_profile(outputs), indent=4))
@@ -0,0 +1,325 @@
+"""
+Monitor topology shared by setup_screens() and configure_monitors().
+
+Outputs are read from RandR via xcffib (GetScreenResourcesCurrent does not re-probe
+the outputs, so it does not re-read EDID like 'xrandr --query' does). The result is
+cached by RandR timestamps: names and modes of outputs are re-read only when the
+config timestamp is changed (hot-plug), positions - when the timestamp is changed
+(e.g. by 'xrandr --output ...'). Otherwise it costs one cheap request.
+
+If RandR is not available, 'xrandr --query' is parsed once and cached until
+invalidate() is called.
+
+The same RandR connection gets RRScreenChangeNotify events, so the caller can wait
+until the server applies a new configuration instead of sleeping.
+
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import subprocess
+from typing import NamedTuple
+
+import xcffib
+import xcffib.randr
+import xcffib.xproto
+
+logger = logging.getLogger(__name__)
+
+
+class Output(NamedTuple):
+    name: str
+    connected: bool
+    primary: bool = False
+    # Geometry of the output, all zeros if it is turned off
+    x: int = 0
+    y: int = 0
+    width: int = 0
+    height: int = 0
+    # Preferred mode as (width, height)
+    preferred: tuple[int, int] | None = None
+    # Short hash of EDID, it identifies a monitor regardless of the port
+    fingerprint: str | None = None
+    rotation: str = "normal"
+    # Refresh rate of the current mode
+    rate: float | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.width > 0 and self.height > 0
+
+
+ROTATIONS = {1: "normal", 2: "left", 4: "inverted", 8: "right"}
+
+
+def edid_fingerprint(edid: bytes) -> str | None:
+    """Short hash of EDID"""
+
+    if not edid:
+        return None
+    return hashlib.sha1(edid).hexdigest()[:16]
+
+
+class _RandrTopology:
+    """Reading outputs via RandR extension"""
+
+    def __init__(self):
+        self.conn = xcffib.connect()
+        self.randr = self.conn(xcffib.randr.key)
+        self.randr.QueryVersion(1, 5).reply()
+        self.root = self.conn.get_setup().roots[self.conn.pref_screen].root
+        self.randr.SelectInput(self.root, xcffib.randr.NotifyMask.ScreenChange)
+        self.edid_atom = self.conn.core.InternAtom(False, len("EDID"), "EDID").reply().atom
+        self.conn.flush()
+        self.config_timestamp = None
+        self.timestamp = None
+        self.output_infos = None
+        self.outputs = None
+
+    def get_outputs(self) -> list[Output]:
+        """Getting outputs, they are re-read only if RandR configuration was changed"""
+
+        resources = self.randr.GetScreenResourcesCurrent(self.root).reply()
+        if resources.config_timestamp != self.config_timestamp:
+            # Outputs were (un)plugged, re-reading their names, modes and EDID
+            self.output_infos = self._read_output_infos(resources)
+            self.config_timestamp = resources.config_timestamp
+            self.timestamp = None
+        if resources.timestamp != self.timestamp:
+            # Only positions were changed, e.g. by 'xrandr --output ...'
+            self.outputs = self._read_geometry(resources)
+            self.timestamp = resources.timestamp
+        return self.outputs
+
+    def _read_output_infos(self, resources) -> list[tuple]:
+        modes = {mode.id: (mode.width, mode.height) for mode in resources.modes}
+
+        # Sending all requests at once and only then waiting for replies
+        cookies = [
+            (output, self.randr.GetOutputInfo(output, resources.config_timestamp))
+            for output in resources.outputs
+        ]
+        infos = [(output, cookie.reply()) for output, cookie in cookies]
+        connected = xcffib.randr.Connection.Connected
+        edid_cookies = {
+            output: self.randr.GetOutputProperty(
+                output, self.edid_atom, xcffib.xproto.GetPropertyType.Any, 0, 128, False, False
+            )
+            for output, info in infos if info.connection == connected
+        }
+
+        output_infos = []
+        for output, info in infos:
+            preferred = modes.get(info.modes[0]) if info.num_preferred else None
+            fingerprint = None
+            if output in edid_cookies:
+                fingerprint = edid_fingerprint(bytes(edid_cookies[output].reply().data))
+            output_infos.append((
+                output,
+                "".join(map(chr, info.name)),
+                info.connection == connected,
+                preferred,
+                fingerprint,
+            ))
+        return output_infos
+
+    def _read_geometry(self, resources) -> list[Output]:
+        rates = {
+            mode.id: mode.dot_clock / (mode.htotal * mode.vtotal)
+            for mode in resources.modes if mode.htotal and mode.vtotal
+        }
+        primary = self.randr.GetOutputPrimary(self.root).reply().output
+        cookies = [
+            self.randr.GetCrtcInfo(crtc, resources.config_timestamp)
+            for crtc in resources.crtcs
+        ]
+        crtcs = {}
+        for cookie in cookies:
+            crtc = cookie.reply()
+            if crtc.mode:
+                for output in crtc.outputs:
+                    crtcs[output] = crtc
+
+        outputs = []
+        for output, name, connected, preferred, fingerprint in self.output_infos:
+            crtc = crtcs.get(output)
+            if crtc is None:
+                outputs.append(Output(name, connected, output == primary, preferred=preferred, fingerprint=fingerprint))
+                continue
+            outputs.append(Output(
+                name, connected, output == primary,
+                crtc.x, crtc.y, crtc.width, crtc.height,
+                preferred, fingerprint,
+                ROTATIONS.get(crtc.rotation & 0xf, "normal"),
+                rates.get(crtc.mode),
+            ))
+        return outputs
+
+    def get_timestamps(self) -> tuple[int, int]:
+        """Current RandR (timestamp, config timestamp)"""
+
+        resources = self.randr.GetScreenResourcesCurrent(self.root).reply()
+        return resources.timestamp, resources.config_timestamp
+
+    def pending_screen_change(self) -> bool:
+        """Reading all queued events, returns True if there was RRScreenChangeNotify"""
+
+        changed = False
+        while True:
+            event = self.conn.poll_for_event()
+            if not event:
+                break
+            if isinstance(event, xcffib.randr.ScreenChangeNotifyEvent):
+                changed = True
+        return changed
+
+    async def wait_for_screen_change(self, timeout) -> bool:
+        """Waiting for RRScreenChangeNotify, returns False on timeout"""
+
+        # Events could be already read from the socket while waiting for a reply
+        if self.pending_screen_change():
+            return True
+
+        loop = asyncio.get_running_loop()
+        changed = loop.create_future()
+
+        def on_readable():
+            if self.pending_screen_change() and not changed.done():
+                changed.set_result(True)
+
+        fd = self.conn.get_file_descriptor()
+        loop.add_reader(fd, on_readable)
+        try:
+            return await asyncio.wait_for(changed, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    def close(self):
+        self.conn.disconnect()
+
+
+XRANDR_OUTPUT_RE = re.compile(
+    r"^(\S+) (connected|disconnected)( primary)?(?: (\d+)x(\d+)\+(\d+)\+(\d+))?"
+    r"(?: (left|right|inverted))?"
+)
+XRANDR_MODE_RE = re.compile(r"^\s+(\d+)x(\d+)\S*\s+(.*)$")
+XRANDR_CURRENT_RATE_RE = re.compile(r"(\d+\.\d+)\*")
+
+
+def parse_xrandr(output: str) -> list[Output]:
+    """Parsing 'xrandr --query' output"""
+
+    outputs = []
+    for line in output.split("\n"):
+        match = XRANDR_OUTPUT_RE.match(line)
+        if match:
+            name, status, primary, width, height, x, y, rotation = match.groups()
+            outputs.append(Output(
+                name,
+                status == "connected",
+                primary is not None,
+                int(x or 0),
+                int(y or 0),
+                int(width or 0),
+                int(height or 0),
+                rotation=rotation or "normal",
+            ))
+            continue
+
+        mode = XRANDR_MODE_RE.match(line)
+        if not mode or not outputs:
+            continue
+        # '+' after the rate marks the preferred mode, '*' - the current one
+        if outputs[-1].preferred is None and "+" in mode.group(3):
+            outputs[-1] = outputs[-1]._replace(preferred=(int(mode.group(1)), int(mode.group(2))))
+        rate = XRANDR_CURRENT_RATE_RE.search(mode.group(3))
+        if rate:
+            outputs[-1] = outputs[-1]._replace(rate=float(rate.group(1)))
+    return outputs
+
+
+# A config reload re-executes the module in the same namespace (importlib.reload), the
+# connection of the previous run is closed, otherwise every reload leaks an X client
+if globals().get("_randr") is not None:
+    try:
+        _randr.close()
+    except Exception as e:
+        logger.warning(f"Closing RandR connection failed: {e}")
+_randr = None
+_xrandr_outputs = None
+
+
+def _call_randr(method, *args):
+    """Calling RandR topology method, returns None if RandR is not available"""
+
+    global _randr
+
+    try:
+        if _randr is None:
+            _randr = _RandrTopology()
+        return getattr(_randr, method)(*args)
+    except Exception as e:
+        logger.warning(f"RandR request failed: {e}")
+        if _randr is not None:
+            _randr.close()
+            _randr = None
+    return None
+
+
+def get_outputs() -> list[Output]:
+    """All the outputs in RandR order"""
+
+    global _xrandr_outputs
+
+    outputs = _call_randr("get_outputs")
+    if outputs is not None:
+        return outputs
+
+    if _xrandr_outputs is None:
+        result = subprocess.run(["xrandr", "--query"], capture_output=True, text=True)
+        _xrandr_outputs = parse_xrandr(result.stdout)
+    return _xrandr_outputs
+
+
+def connected_outputs() -> list[Output]:
+    """Connected outputs in RandR order"""
+
+    return [output for output in get_outputs() if output.connected]
+
+
+def invalidate():
+    """
+    Dropping outputs cached from xrandr, must be called after hot-plug or changing
+    the configuration. RandR results are checked by timestamps on every call.
+    """
+
+    global _xrandr_outputs
+
+    _xrandr_outputs = None
+
+
+def get_timestamps() -> tuple[int, int] | None:
+    """RandR timestamps, they are changed by any change of the configuration"""
+
+    return _call_randr("get_timestamps")
+
+
+def drain_events():
+    """Dropping queued RRScreenChangeNotify events before applying a new configuration"""
+
+    _call_randr("pending_screen_change")
+
+
+async def wait_for_screen_change(timeout) -> bool:
+    """Waiting until the server reports a new configuration, returns False on timeout"""
+
+    waiting = _call_randr("wait_for_screen_change", timeout)
+    if waiting is None:
+        # Without RandR events just give the server time to apply changes
+        await asyncio.sleep(timeout)
+        return False
+    return await waiting
@@ -0,0 +1,162 @@
+"""
+Config of RDP connections: groups with inherited defaults, per-host overrides and
+include files, for example ~/.config/rdp_connector.json:
+
+{
+    "defaults": {"params": "-grab-keyboard /dynamic-resolution /cert:ignore"},
+    "include": ["rdp_connector.d/*.json"],
+    "groups": [
+        {
+            "name": "project-a",
+            "defaults": {"username": "admin"},
+            "hosts": [
+                {"name": "db", "ip_address": "10.0.0.10"},
+                {"name": "web", "ip_address": "10.0.0.11", "params": "/dynamic-resolution"}
+            ],
+            "groups": [{"name": "test", "hosts": [{"name": "db", "ip_address": "10.0.1.10"}]}]
+        }
+    ],
+    "hosts": [{"name": "home-pc", "ip_address": "192.168.1.2:3390", "username": "me"}]
+}
+
+A host gets defaults of the top level, then of every enclosing group, then its own
+fields. Hosts of a group are named by the group path: "project-a/test/db". Included
+files (paths are relative to the including file, globs are allowed) have the same
+format and the defaults of the including file. The old flat list of connections
+with "connection_name" is still a valid config.
+
+The config is compiled once into {connection name: connection} with the fields
+rdp_connector.py uses, and every error is reported with the file and the place
+in it. The result is cached by custom_utils.rdp_index.
+
+"""
+
+import glob
+import json
+from pathlib import Path
+
+CONNECTION_FIELDS = {"ip_address", "username", "password", "params"}
+HOST_KEYS = CONNECTION_FIELDS | {"name", "connection_name"}
+GROUP_KEYS = {"name", "defaults", "hosts", "groups"}
+FILE_KEYS = {"defaults", "include", "hosts", "groups"}
+
+
+class ConfigError(Exception):
+    pass
+
+
+def _check_fields(data, allowed, where):
+    if not isinstance(data, dict):
+        raise ConfigError(f"{where}: must be an object")
+    unknown = set(data) - allowed
+    if unknown:
+        raise ConfigError(f"{where}: unknown keys {', '.join(sorted(unknown))}")
+
+
+def _check_defaults(defaults, where) -> dict:
+    _check_fields(defaults, CONNECTION_FIELDS, where)
+    for key, value in defaults.items():
+        if value is not None and not isinstance(value, str):
+            raise ConfigError(f"{where}: '{key}' must be a string or null")
+    return defaults
+
+
+class _Compiler:
+    def __init__(self):
+        self.connections = {}
+        # Files and include directories with their stats, the cache depends on them
+        self.dependencies = []
+        self._files = set()
+
+    def add_dependency(self, path):
+        self.dependencies.append((str(path), file_stat(path)))
+
+    def compile_file(self, path, defaults, prefix):
+        path = Path(path).expanduser().resolve()
+        if path in self._files:
+            raise ConfigError(f"{path}: included more than once")
+        self._files.add(path)
+        self.add_dependency(path)
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"{path}: {e}") from e
+
+        if isinstance(data, list):
+            # The old flat list of connections
+            self.compile_hosts(data, defaults, prefix, f"{path}")
+            return
+
+        _check_fields(data, FILE_KEYS, f"{path}")
+        defaults = {**defaults, **_check_defaults(data.get("defaults", {}), f"{path}: defaults")}
+        self.compile_hosts(data.get("hosts", []), defaults, prefix, f"{path}: hosts")
+        self.compile_groups(data.get("groups", []), defaults, prefix, f"{path}: groups")
+
+        includes = data.get("include", [])
+        if not isinstance(includes, list):
+            raise ConfigError(f"{path}: include must be a list")
+        for pattern in includes:
+            pattern = Path(path.parent, Path(pattern).expanduser())
+            # A new file in the directory must invalidate the cache
+            self.add_dependency(pattern.parent)
+            for included in sorted(glob.glob(str(pattern))):
+                self.compile_file(included, defaults, prefix)
+
+    def compile_groups(self, groups, defaults, prefix, where):
+        if not isinstance(groups, list):
+            raise ConfigError(f"{where}: must be a list")
+        for i, group in enumerate(groups):
+            group_where = f"{where}[{i}]"
+            _check_fields(group, GROUP_KEYS, group_where)
+            if not isinstance(group.get("name"), str) or not group["name"]:
+                raise ConfigError(f"{group_where}: 'name' is required")
+            group_where = f"{where}[{group['name']}]"
+            group_defaults = {
+                **defaults,
+                **_check_defaults(group.get("defaults", {}), f"{group_where}: defaults"),
+            }
+            group_prefix = f"{prefix}{group['name']}/"
+            self.compile_hosts(group.get("hosts", []), group_defaults, group_prefix, f"{group_where}: hosts")
+            self.compile_groups(group.get("groups", []), group_defaults, group_prefix, f"{group_where}: groups")
+
+    def compile_hosts(self, hosts, defaults, prefix, where):
+        if not isinstance(hosts, list):
+            raise ConfigError(f"{where}: must be a list")
+        for i, host in enumerate(hosts):
+            host_where = f"{where}[{i}]"
+            _check_fields(host, HOST_KEYS, host_where)
+            name = host.get("name", host.get("connection_name"))
+            if not isinstance(name, str) or not name:
+                raise ConfigError(f"{host_where}: 'name' is required")
+            name = f"{prefix}{name}"
+            if name in self.connections:
+                raise ConfigError(f"{host_where}: duplicate connection {name}")
+
+            fields = {key: value for key, value in host.items() if key in CONNECTION_FIELDS}
+            connection = {
+                **dict.fromkeys(CONNECTION_FIELDS),
+                **defaults,
+                **_check_defaults(fields, host_where),
+            }
+            connection["connection_name"] = name
+            self.connections[name] = connection
+
+
+def file_stat(path) -> tuple[int, int] | None:
+    """(mtime, size) of a file or a directory, None if it does not exist"""
+
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def compile_config(path) -> tuple[dict[str, dict], list[tuple[str, tuple | None]]]:
+    """Returns ({connection name: connection}, [(dependency path, its stat)])"""
+
+    compiler = _Compiler()
+    compiler.compile_file(path, {}, "")
+    return compiler.connections, compiler.dependencies
@@ -0,0 +1,153 @@
+"""
+Index of RDP connections from ~/.config/rdp_connector.json.
+
+The config compiled by custom_utils.rdp_config is cached in
+~/.cache/rdp_connector/index.pickle and is compiled again only when the config or
+one of its include files (or directories) is changed (mtime and size), so the menu
+does not parse and validate thousands of hosts on every launch. Connections are
+looked up by name in a dict.
+
+Every connection made is recorded in ~/.cache/rdp_connector/usage.json, and the
+menu lists connections by frecency: the number of uses which fades with time since
+the last use, so the hosts used recently and often come first.
+
+Compiled connections keep the passwords of the config, so both files are readable
+only by the user, as the config should be.
+
+"""
+
+import json
+import os
+import pickle
+import time
+from pathlib import Path
+
+from custom_utils.rdp_config import compile_config, file_stat
+
+CONFIG_FILE = Path(Path.home(), ".config", "rdp_connector.json")
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path(Path.home(), ".cache")), "rdp_connector")
+
+# Days after which the weight of uses is halved
+USAGE_HALF_LIFE = 14
+# Changing the cached data format must change the version
+CACHE_VERSION = 2
+
+
+def _write_atomic(path, data: bytes):
+    """Writing via a temporary file, so a concurrent reader never gets a partial file"""
+
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    # A left temporary file may have other permissions, the new one is created 0600
+    tmp_path.unlink(missing_ok=True)
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    tmp_path.replace(path)
+
+
+class ConnectionIndex:
+    """Connections by name, cached between launches and ranked by usage"""
+
+    def __init__(self, config_file=CONFIG_FILE, cache_dir=CACHE_DIR):
+        self.config_file = Path(config_file)
+        self.cache_file = Path(cache_dir, "index.pickle")
+        self.usage_file = Path(cache_dir, "usage.json")
+        self._dependencies = None
+        self._names = []
+        self._connections_data = None
+        self._by_name = None
+        self._usage = None
+
+    def _changed(self, dependencies) -> bool:
+        if dependencies[0][0] != str(self.config_file.expanduser().resolve()):
+            return True
+        return any(file_stat(path) != stat for path, stat in dependencies)
+
+    def _load(self):
+        """Loading the index, the config is compiled only if it was changed"""
+
+        if self._dependencies is not None and not self._changed(self._dependencies):
+            return
+
+        try:
+            with open(self.cache_file, "rb") as f:
+                version, dependencies, names, connections_data = pickle.load(f)
+            valid = version == CACHE_VERSION and not self._changed(dependencies)
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError):
+            valid = False
+        if not valid:
+            # ConfigError of an invalid config goes to the caller
+            by_name, dependencies = compile_config(self.config_file)
+            # Sorted once here, not on every launch
+            names = sorted(by_name)
+            # Connections are unpickled only when they are needed, the menu needs names
+            connections_data = pickle.dumps(by_name, pickle.HIGHEST_PROTOCOL)
+            try:
+                _write_atomic(
+                    self.cache_file,
+                    pickle.dumps(
+                        (CACHE_VERSION, dependencies, names, connections_data),
+                        pickle.HIGHEST_PROTOCOL,
+                    ),
+                )
+            except OSError:
+                pass
+
+        self._dependencies, self._names, self._connections_data = dependencies, names, connections_data
+        self._by_name = None
+
+    def connections(self) -> dict[str, dict]:
+        """{name: connection}"""
+
+        self._load()
+        if self._by_name is None:
+            self._by_name = pickle.loads(self._connections_data)
+        return self._by_name
+
+    def get(self, name) -> dict | None:
+        return self.connections().get(name)
+
+    def usage(self) -> dict[str, dict]:
+        """{name: {"count": ..., "last": unix time}}"""
+
+        if self._usage is None:
+            try:
+                self._usage = json.loads(self.usage_file.read_text())
+            except (OSError, ValueError):
+                self._usage = {}
+        return self._usage
+
+    def score(self, name, now=None) -> float:
+        usage = self.usage().get(name)
+        if not usage:
+            return 0.0
+        age_days = ((now or time.time()) - usage["last"]) / 86400
+        return usage["count"] * 0.5 ** (age_days / USAGE_HALF_LIFE)
+
+    def ranked(self) -> list[str]:
+        """Names of connections by frecency, unused ones by name"""
+
+        self._load()
+        usage = self.usage()
+        if not usage:
+            return list(self._names)
+
+        now = time.time()
+        names = set(self._names)
+        used = sorted(
+            (name for name in usage if name in names),
+            key=lambda name: (-self.score(name, now), name),
+        )
+        used_set = set(used)
+        return used + [name for name in self._names if name not in used_set]
+
+    def record_use(self, name):
+        usage = self.usage()
+        entry = usage.setdefault(name, {"count": 0, "last": 0})
+        entry["count"] += 1
+        entry["last"] = time.time()
+        try:
+            _write_atomic(self.usage_file, json.dumps(usage).encode())
+        except OSError:
+            pass
@@ -0,0 +1,116 @@
+"""
+Wallpaper pre-scaled for every monitor.
+
+The image is scaled (with cropping, the aspect ratio is kept) to the resolution of
+every enabled output and the results are cached in ~/.cache/qtile/wallpapers, keyed
+by the image, its mtime and the resolution. So a large JPEG is decoded and rescaled
+only when a new resolution appears, otherwise the cached images are composed into
+one root image placed by the output positions and set by feh.
+
+Pillow is optional: without it the whole image is set by 'feh --bg-fill'.
+
+Run scripts/set_wallpaper.py to set it, it is done on login and on hot-plug.
+
+"""
+
+import hashlib
+import logging
+import os
+import subprocess
+from pathlib import Path
+
+from custom_utils import monitors
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+WALLPAPER = Path(Path.home(), "Pictures/wallpapers/cyberpunk-hd-wallpaper.jpg")
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path(Path.home(), ".cache")), "qtile/wallpapers")
+
+
+def _image_key(image) -> str:
+    """Cache key prefix of the image version"""
+
+    path_hash = hashlib.sha1(str(image.resolve()).encode()).hexdigest()[:12]
+    return f"{path_hash}-{image.stat().st_mtime_ns}"
+
+
+def _drop_stale(image, key, cache_dir):
+    """Removing cached images of the previous versions of the image"""
+
+    path_hash = key.split("-")[0]
+    for path in cache_dir.glob(f"{path_hash}-*"):
+        if not path.name.startswith(key):
+            path.unlink(missing_ok=True)
+    for path in cache_dir.glob("root-*"):
+        if not path.name.startswith(f"root-{key}"):
+            path.unlink(missing_ok=True)
+
+
+def scaled(image, size, cache_dir=CACHE_DIR) -> Path:
+    """Path to the image scaled to size (width, height), it is scaled only once"""
+
+    key = _image_key(image)
+    path = Path(cache_dir, f"{key}-{size[0]}x{size[1]}.jpg")
+    if path.exists():
+        return path
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _drop_stale(image, key, cache_dir)
+    logger.info(f"Scaling wallpaper {image} to {size[0]}x{size[1]}")
+    with Image.open(image) as source:
+        result = ImageOps.fit(source.convert("RGB"), size, Image.LANCZOS)
+    # Writing to a temporary file, so a concurrent run does not read a partial image
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    result.save(tmp_path, "JPEG", quality=95)
+    tmp_path.replace(path)
+    return path
+
+
+def compose(image, outputs, cache_dir=CACHE_DIR) -> Path:
+    """Root image with the scaled image on every output, cached by the layout"""
+
+    geometries = [(o.x, o.y, o.width, o.height) for o in outputs]
+    layout_hash = hashlib.sha1(repr(sorted(geometries)).encode()).hexdigest()[:12]
+    path = Path(cache_dir, f"root-{_image_key(image)}-{layout_hash}.jpg")
+    if path.exists():
+        return path
+
+    width = max(x + w for x, _, w, _ in geometries)
+    height = max(y + h for _, y, _, h in geometries)
+    root = Image.new("RGB", (width, height))
+    for x, y, w, h in geometries:
+        with Image.open(scaled(image, (w, h), cache_dir)) as tile:
+            root.paste(tile, (x, y))
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    root.save(tmp_path, "JPEG", quality=95)
+    tmp_path.replace(path)
+    return path
+
+
+def feh_command(image=WALLPAPER, outputs=None) -> list[str]:
+    """feh command setting the wallpaper for the current layout"""
+
+    if Image is None:
+        return ["feh", "--bg-fill", str(image)]
+
+    if outputs is None:
+        outputs = monitors.get_outputs()
+    enabled = [output for output in outputs if output.enabled]
+    if not enabled:
+        return ["feh", "--bg-fill", str(image)]
+    # The root image covers all the outputs, feh must not split it by Xinerama screens
+    return ["feh", "--no-xinerama", "--bg-tile", str(compose(image, enabled))]
+
+
+def set_wallpaper(image=WALLPAPER) -> bool:
+    try:
+        command = feh_command(image)
+    except OSError as e:
+        logger.error(f"Preparing wallpaper error: {e}")
+        return False
+    return subprocess.run(command).returncode == 0
@@ -1,47 +1,142 @@
+#!/usr/bin/env python3
 """
 The work of this solution based on parsing LED mask: 00000000. Run the script to detect
 which bits responsible for switching layouts in your system, just run it and switching.
 
-"""
+By default the script gets XKB indicator events, so every change is printed immediately.
+If XKB extension is not available it falls back to polling 'xset -q'.
 
-#!/usr/bin/env python3
+Usage:
+    get_led_mask.py             - print every change of LED mask
+    get_led_mask.py --suggest   - switch layouts a few times, then the script prints
+                                  'group_led_bits' for SystemKeyboardLayout widget
+    get_led_mask.py --poll      - use 'xset -q' even if XKB is available
+
+"""
 
+import argparse
+import select
 import subprocess
+import sys
 import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from custom_utils.xset_parser import parse_led_mask
+
+POLL_INTERVAL = 0.5
+
+
+def xkb_changes():
+    """Yielding (led_mask, group) on every XKB state change"""
+
+    from custom_utils.xkb import STATE_EVENTS, XkbConnection
+
+    xkb = XkbConnection()
+    try:
+        yield xkb.get_indicators(), xkb.get_group()
+        while True:
+            select.select([xkb.fileno()], [], [])
+            if xkb.pending_events() & STATE_EVENTS:
+                yield xkb.get_indicators(), xkb.get_group()
+    finally:
+        xkb.close()
+
 
-def monitor_led_changes():
+def xset_changes():
+    """Yielding (led_mask, None) polling 'xset -q', the group is unknown"""
+
+    while True:
+        result = subprocess.run(['xset', '-q'], capture_output=True)
+        led_mask = parse_led_mask(result.stdout) if result.returncode == 0 else None
+        if led_mask is not None:
+            yield led_mask, None
+        time.sleep(POLL_INTERVAL)
+
+
+def suggest_group_led_bits(samples) -> list[int]:
+    """Detecting LED bits which follow the bits of the group index"""
+
+    groups = {group for _, group in samples}
+    if None in groups:
+        # Without XKB only changed bits are known
+        changed = 0
+        for led_mask, _ in samples:
+            changed |= led_mask ^ samples[0][0]
+        return [bit for bit in range(32) if changed & (1 << bit)]
+
+    group_bits = max(groups).bit_length()
+    led_bits = []
+    for i in range(group_bits):
+        for bit in range(32):
+            if all(bool(mask & (1 << bit)) == bool(group & (1 << i)) for mask, group in samples):
+                led_bits.append(bit)
+                break
+    return led_bits
+
+
+def monitor_led_changes(use_xkb=True, suggest=False, switches=4):
     print("Monitoring changes of LED mask...")
     print("Switch keyboard layouts and watch changes")
     print("Press Ctrl+C to exit")
-    
-    last_mask = None
-    
+
+    if use_xkb:
+        try:
+            changes = xkb_changes()
+            next_change = next(changes)
+            print("Using XKB events")
+        except Exception as e:
+            print(f"XKB is not available ({e}), polling 'xset -q'")
+            changes = xset_changes()
+            next_change = next(changes)
+    else:
+        changes = xset_changes()
+        next_change = next(changes)
+
+    last_mask, _ = next_change
+    samples = [next_change]
+    switched = 0
+
     try:
-        while True:
-            result = subprocess.run(['xset', '-q'], capture_output=True, text=True)
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'LED mask:' in line:
-                        led_hex = line.split('LED mask:')[-1].strip()
-                        led_mask = int(led_hex, 16)
-                        
-                        if last_mask is not None and led_mask != last_mask:
-                            print(f"LED mask changed: {last_mask:08x} -> {led_mask:08x}")
-                            print(f"Changed bits: {last_mask ^ led_mask:08x}")
-                            
-                            changed_bits = last_mask ^ led_mask
-                            for bit in range(0, 32):
-                                if changed_bits & (1 << bit):
-                                    print(f"  Bit {bit} (0x{1 << bit:08x}) changed")
-                            
-                            print("-" * 40)
-                        
-                        last_mask = led_mask
-                        break
-            
-            time.sleep(0.5)
+        for led_mask, group in changes:
+            if led_mask == last_mask:
+                continue
+
+            timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+            changed_bits = last_mask ^ led_mask
+            group_info = f" (group {group})" if group is not None else ""
+            print(f"{timestamp} LED mask changed: {last_mask:08x} -> {led_mask:08x}{group_info}")
+            print(f"Changed bits: {changed_bits:08x}")
+            for bit in range(0, 32):
+                if changed_bits & (1 << bit):
+                    print(f"  Bit {bit} (0x{1 << bit:08x}) changed")
+            print("-" * 40)
+
+            last_mask = led_mask
+            samples.append((led_mask, group))
+            switched += 1
+
+            if suggest and switched >= switches:
+                print(f"group_led_bits={suggest_group_led_bits(samples)}")
+                return
     except KeyboardInterrupt:
         print("\nStop monitoring")
+        if suggest and switched:
+            print(f"group_led_bits={suggest_group_led_bits(samples)}")
+
 
 if __name__ == "__main__":
-    monitor_led_changes()
+    parser = argparse.ArgumentParser(description="Detecting LED bits used for keyboard layouts")
+    parser.add_argument("--poll", action="store_true", help="poll 'xset -q' instead of XKB events")
+    parser.add_argument(
+        "--suggest", action="store_true",
+        help="print 'group_led_bits' for SystemKeyboardLayout after a few switches"
+    )
+    parser.add_argument(
+        "--switches", type=int, default=4,
+        help="number of layout switches for --suggest (default: 4)"
+    )
+    args = parser.parse_args()
+    monitor_led_changes(use_xkb=not args.poll, suggest=args.suggest, switches=args.switches)
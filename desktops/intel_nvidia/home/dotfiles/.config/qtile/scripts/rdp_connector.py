@@ -1,14 +1,37 @@
 #!/usr/bin/env python3
+"""
+xfreerdp3 connections menu. Sessions are supervised by one daemon, see
+custom_utils/rdp_daemon.py, it is started by qtile or on the first connection.
+Passwords are taken from the keyring (Secret Service) and are passed to xfreerdp3
+by stdin, a password typed in rofi is stored in the keyring after connecting.
+
+Usage:
+    rdp_connector.py                  - select a connection in rofi and connect
+    rdp_connector.py --probe          - the same, hosts are marked as up (with latency) or down
+    rdp_connector.py sessions         - select a running session in rofi, kill or reconnect it
+    rdp_connector.py list             - print sessions
+    rdp_connector.py kill NAME        - close a session
+    rdp_connector.py reconnect NAME   - close a session and connect again
+    rdp_connector.py --daemon         - run the sessions daemon
+
+"""
+import argparse
+import asyncio
 import json
 import subprocess
-import threading
-import os
-import time
-import shlex
+import sys
 from pathlib import Path
 
-HOME_DIR = Path.home()
-CONFIG_FILE = Path(HOME_DIR, ".config","rdp_connector.json")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from custom_utils import rdp_daemon
+from custom_utils.logs import log_to_file
+from custom_utils.notifications import Notifier
+from custom_utils.rdp_config import ConfigError
+from custom_utils.rdp_index import ConnectionIndex
+from custom_utils.secret_store import SecretStore
+from custom_utils.tcp_probe import probe_address, probe_all
+
 FREE_CONN_NAME = "Connect to..."
 FREE_CONN = {
     "connection_name": FREE_CONN_NAME,
@@ -17,6 +40,12 @@ FREE_CONN = {
     "ip_address": None,
     "params": "-grab-keyboard /dynamic-resolution"
 }
+# Exit codes of xfreerdp3 after closing a session normally
+CLOSED_EXIT_CODES = (0, 1, 12)
+DAEMON_START_TIMEOUT = 2
+PROBE_TIMEOUT = 0.5
+# Seconds the daemon keeps passwords from the keyring in memory
+PASSWORD_TTL = 600
 
 
 class NonificationManager:
@@ -30,25 +59,22 @@ class NonificationManager:
         "successful": ("normal", "✅ Connected to {}"),
         "failed": ("critical", "❌ Failed to connect to {}"),
         "lost": ("critical", "🚫 Connection {} lost"),
+        "unreachable": ("critical", "🚫 Host {} is unreachable"),
         "error": ("critical", "❌ Connection process was not started {}"),
+        "config": ("critical", "❌ Invalid config {}"),
         "started": ("normal", "✅ Monitoring process started {}")
     }
 
-    @classmethod
-    def _escape_for_dunst(cls, text:str ) -> str:
-        """Replace "\" to "\\" """
-
-        return text.replace("\\", "\\\\")
+    # D-Bus connection is opened on the first notification
+    notifier = Notifier(title)
 
     @classmethod
-    def send(cls, notification_type, connection_name):
-        """Sending a notification"""
+    async def send(cls, notification_type, connection_name, key=None):
+        """Sending a notification, it replaces the previous one with the same key"""
 
         severity, template = cls.templates[notification_type]
-        message = template.format(cls._escape_for_dunst(connection_name))
-
-        cmd = f"dunstify -u {severity} '{cls.title}' '{message}'"
-        subprocess.run(shlex.split(cmd))
+        message = template.format(connection_name)
+        await cls.notifier.notify(cls.title, message, severity, key)
 
 
 def rofi_prompt(prompt, password=False):
@@ -62,58 +88,110 @@ def rofi_prompt(prompt, password=False):
     except subprocess.CalledProcessError:
         return None
 
-def get_connections():
-    """Reading config files"""
-    with open(CONFIG_FILE) as f:
-        return json.load(f)
-
-def select_connection(connections) -> dict | None:
-    """Selecting a connection from the list"""
-
-    names = sorted([c["connection_name"] for c in connections])
-    names.append(FREE_CONN_NAME)
+def rofi_menu(prompt, options) -> str | None:
+    """Selecting one of the options"""
 
     try:
-        result = subprocess.check_output(
-            ["rofi", "-i", "-dmenu", "-p", "Select connection:"],
-            input="\n".join(names),
+        return subprocess.check_output(
+            ["rofi", "-i", "-dmenu", "-p", prompt],
+            input="\n".join(options),
             text=True
         ).strip()
-        if result == FREE_CONN_NAME:
-            return FREE_CONN
-        connection = next(c for c in connections if c["connection_name"] == result)
     except subprocess.CalledProcessError:
         return None
-    except StopIteration:
+
+def probe_label(latency) -> str:
+    return "🔴 down" if latency is None else f"🟢 {latency:.0f} ms"
+
+def select_connection(index, latencies=None) -> dict | None:
+    """Selecting a connection, the most used are the first, latencies {name: ms} are shown if given"""
+
+    labels = {}
+    for name in index.ranked():
+        label = name
+        if latencies is not None and name in latencies:
+            label = f"{name}   {probe_label(latencies[name])}"
+        labels[label] = name
+    labels[FREE_CONN_NAME] = FREE_CONN_NAME
+
+    result = rofi_menu("Select connection:", labels)
+    if result == FREE_CONN_NAME:
+        return FREE_CONN
+    return index.get(labels[result]) if result in labels else None
+
+async def start_daemon():
+    """Starting the daemon in background if it is not running"""
+
+    if await rdp_daemon.is_running():
+        return
+    subprocess.Popen(
+        [sys.executable, __file__, "--daemon"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DAEMON_START_TIMEOUT
+    while not await rdp_daemon.is_running():
+        if loop.time() > deadline:
+            raise ConnectionError("RDP connector daemon has not started")
+        await asyncio.sleep(0.05)
+
+async def daemon_request(message) -> dict | None:
+    """Sending a request to the daemon, errors are shown as notifications"""
+
+    try:
+        await start_daemon()
+        response = await rdp_daemon.request(message)
+    except (OSError, asyncio.TimeoutError, ValueError) as e:
+        await NonificationManager.send("error", str(e))
+        return None
+    if not response["ok"]:
+        await NonificationManager.send("error", response["error"])
         return None
+    return response
 
-    return connection
+async def manage_sessions():
+    """Killing or reconnecting a running session"""
 
-def check_connection_status(
-        process: subprocess.Popen, 
-        connection_name: str, ip_address: str, time_out: int = 2
-):
-    """Checking connection status"""
+    response = await daemon_request({"command": "list"})
+    if not response or not response["sessions"]:
+        return
+    sessions = {
+        f"{session['name']} [{session['state']}]": session["name"]
+        for session in response["sessions"]
+    }
+    selected = rofi_menu("Select session:", sessions)
+    if selected not in sessions:
+        return
+    action = rofi_menu(f"{sessions[selected]}:", ["Kill", "Reconnect"])
+    if action in ("Kill", "Reconnect"):
+        await daemon_request({"command": action.lower(), "name": sessions[selected]})
 
-    time.sleep(time_out)
-    
-    if process.poll() is None:
-        NonificationManager.send("successful", f"{connection_name} {ip_address}")
-    
-    exit_code = process.wait()
-
-    if exit_code == 0 or exit_code == 1 or exit_code == 12:
-        NonificationManager.send("closed", f"{connection_name} - {ip_address}")
-    elif exit_code == 141:
-        NonificationManager.send("failed", f"{connection_name} - {ip_address}")
-    elif exit_code == 147:
-        NonificationManager.send("lost", f"{connection_name} - {ip_address}")
-    else:
-        NonificationManager.send("failed", f"{connection_name} - {ip_address}")
-    
-def main():
-    connections = get_connections()
-    selected = select_connection(connections)
+async def run_daemon():
+    supervisor = rdp_daemon.SessionSupervisor(
+        NonificationManager.send, CLOSED_EXIT_CODES, secrets=SecretStore(ttl=PASSWORD_TTL)
+    )
+    await supervisor.serve()
+
+async def main(probe=False):
+    # Compiled config is cached between launches
+    index = ConnectionIndex()
+    latencies = None
+    try:
+        if probe:
+            # All the hosts are probed concurrently, it takes about PROBE_TIMEOUT
+            addresses = {
+                name: probe_address(c["ip_address"], (c.get("params") or "").split())
+                for name, c in index.connections().items() if c.get("ip_address")
+            }
+            by_address = await probe_all(filter(None, addresses.values()), PROBE_TIMEOUT)
+            latencies = {name: by_address[address] for name, address in addresses.items() if address}
+        selected = select_connection(index, latencies)
+    except ConfigError as e:
+        await NonificationManager.send("config", str(e))
+        return
     if selected is None:
         return
     
@@ -125,10 +203,17 @@ def main():
         selected.get("username") or
         rofi_prompt(f"👤 Username for {selected['connection_name']}")
     )
-    password = (
-        selected.get("password") or
-        rofi_prompt(f"🔒 Password for {username}", password=True)
-    )
+    password = selected.get("password")
+    remember_password = False
+    if not password and username and ip_address:
+        # The daemon keeps passwords from the keyring for a while
+        response = await daemon_request({
+            "command": "password", "username": username, "ip_address": ip_address
+        })
+        password = response and response["password"]
+    if not password:
+        password = rofi_prompt(f"🔒 Password for {username}", password=True)
+        remember_password = True
     params = (
         selected.get("params") or
         rofi_prompt(f"⚙️ Additional params for {selected['connection_name']}")
@@ -137,29 +222,52 @@ def main():
     if not all([username, password, ip_address]):
         return
 
-    NonificationManager.send(
-        "connecting",f"{selected['connection_name']} - {ip_address} as {username}"
-    )
-
+    # The password is not on the command line, it is visible in ps to everyone
+    params = (params or "").split()
     cmd = [
         "xfreerdp3",
         f"/u:{username}",
-        f"/p:{password}",
         f"/v:{ip_address}",
-        *params.split()
-    ] if params else [
-        "xfreerdp3",
-        f"/u:{username}",
-        f"/p:{password}",
-        f"/v:{ip_address}"
-        "/from-stdin"
+        "/from-stdin:force",
+        *params
     ]
+    connection = {
+        "name": selected["connection_name"],
+        "ip_address": ip_address,
+        "username": username,
+        "command": cmd,
+        "stdin": rdp_daemon.credentials_input(username, password, params),
+    }
+    if remember_password:
+        connection.update(password=password, remember_password=True)
 
-    try:
-        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, text=True)
-        check_connection_status(process, selected["connection_name"], selected["ip_address"])
-    except subprocess.CalledProcessError:
-        NonificationManager.send("error", "")
+    # The daemon notifies about connecting and supervises the session
+    response = await daemon_request({"command": "connect", "connection": connection})
+    if response and selected is not FREE_CONN:
+        index.record_use(selected["connection_name"])
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="xfreerdp3 connections menu")
+    parser.add_argument("--daemon", action="store_true", help="run the sessions daemon")
+    parser.add_argument("--probe", action="store_true", help="show which hosts are up in the menu")
+    parser.add_argument("command", nargs="?", choices=("sessions", "list", "kill", "reconnect"))
+    parser.add_argument("name", nargs="?", help="session name for kill and reconnect")
+    args = parser.parse_args()
+    log_to_file("rdp_connector")
+
+    if args.daemon:
+        asyncio.run(run_daemon())
+    elif args.command == "sessions":
+        asyncio.run(manage_sessions())
+    elif args.command == "list":
+        response = asyncio.run(daemon_request({"command": "list"}))
+        if response:
+            print(json.dumps(response["sessions"], indent=4))
+    elif args.command in ("kill", "reconnect"):
+        if not args.name:
+            parser.error(f"{args.command} requires a session name")
+        response = asyncio.run(daemon_request({"command": args.command, "name": args.name}))
+        if response:
+            print(json.dumps(response["session"], indent=4))
+    else:
+        asyncio.run(main(probe=args.probe))
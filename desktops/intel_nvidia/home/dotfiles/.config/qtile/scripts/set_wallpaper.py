@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Setting the wallpaper pre-scaled for every monitor, see custom_utils/wallpaper.py.
+It is run by qtile on login and after hot-plug, so scaling does not block qtile.
+
+Usage:
+    set_wallpaper.py [image]   - by default ~/Pictures/wallpapers/cyberpunk-hd-wallpaper.jpg
+
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from custom_utils.logs import log_to_file
+from custom_utils.wallpaper import WALLPAPER, set_wallpaper
+
+if __name__ == "__main__":
+    log_to_file("set_wallpaper")
+    image = Path(sys.argv[1]).expanduser() if len(sys.argv) > 1 else WALLPAPER
+    sys.exit(0 if set_wallpaper(image) else 1)
@@ -8,7 +8,11 @@ Perhaps a workaround exists to resolve this issue, but I could not find it.
 
 Because of that I made this solution. I tried to write it like qtile's standard widget.
 
-requirements utils: setxkbmap, xset.
+requirements utils: setxkbmap, xset (only for 'xset' backend).
+
+By default the widget uses 'xkb' backend: it talks to the X server via xcffib and gets
+XkbStateNotify/XkbIndicatorStateNotify events, so the layout is updated immediately without polling.
+If XKB extension is not available the widget falls back to 'xset' backend which polls 'xset -q'.
 
 You should setup switching layouts on system level. After that switching layouts starts working in rofi window
 and this solution will only show current keyboard layout.
@@ -18,12 +22,20 @@ to detect which bits responsible for switching layouts in your system, just run
 
 """
 
+import asyncio
+import time
 from abc import ABCMeta, abstractmethod
-from subprocess import check_output
+from subprocess import DEVNULL, check_output
 
+from libqtile.command.base import expose_command
 from libqtile.log_utils import logger
 from libqtile.widget import base
 
+from custom_utils.screensaver import ScreenSaverInfo
+from custom_utils.xkb import LAYOUT_EVENTS, STATE_EVENTS, XkbConnection, XkbUnavailable
+from custom_utils.xset_parser import parse_layouts, parse_led_mask
+from widgets.mixins import RenderDiffMixin
+
 
 class _BaseSystemLayoutBackend(metaclass=ABCMeta):
     def __init__(self, qtile=None):
@@ -54,80 +66,448 @@ class _SystemBackend(_BaseSystemLayoutBackend):
     Default utils are:
     xset - for getting and parsing LED bits.
     setxkbmap - for getting current layouts.
+
+    Every method has an async variant (with 'a' prefix) which runs the utils in a
+    thread, so a slow X server does not block qtile's event loop. They are not asyncio
+    subprocesses: qtile's SIGCHLD handler reaps them first and asyncio reports exit
+    code 255, subprocess takes an already reaped child as exited with 0.
     """
 
     layout_command = "xset -q"
     layouts_command = "setxkbmap -query"
     layouts = None
+    # There are no events without XKB, so layouts are re-read from time to time
+    layouts_ttl = 30
+    layouts_time = None
+    # Seconds to wait for xset/setxkbmap before killing them
+    command_timeout = 2
 
     def get_keyboard(self, group_led_bits) -> str:
         """Detecting current layout"""
 
         try:
-            led_mask = self.get_led_mask()
-            if led_mask is None:
-                return self.layouts[0] if self.layouts else "unknown"
-            
-            # Detect the group by bit
-            group = 0
-            for i, bit in enumerate(group_led_bits):
-                if led_mask & (1 << bit):
-                    group |= (1 << i)
-            # group = 1 if (led_mask & (1 << group_led_bits)) else 0
-            
-
-            if group < len(self.layouts):
-                return self.layouts[group]
-            else:
-                return self.layouts[0]
-                
+            layouts = self.get_available_layouts()
+            return self.select_layout(layouts, self.get_led_mask(), group_led_bits)
         except Exception as e:
             logger.error(f"Layout detecting error: {e}")
             return self.layouts[0] if self.layouts else "unknown"
 
-    def get_available_layouts(self) -> list[str]:
-        """Getting list of keyboard layouts"""
+    async def aget_keyboard(self, group_led_bits) -> str | None:
+        """Detecting current layout, returns None if LED mask is not available"""
 
         try:
-            result = check_output(self.layouts_command.split(" ")).decode()
+            layouts = await self.aget_available_layouts()
+            led_mask = await self.aget_led_mask()
+            if led_mask is None:
+                return None
+            return self.select_layout(layouts, led_mask, group_led_bits)
+        except Exception as e:
+            logger.error(f"Layout detecting error: {e}")
+            return None
+
+    @staticmethod
+    def select_layout(layouts, led_mask, group_led_bits) -> str:
+        """Detecting the group by LED bits"""
+
+        if led_mask is None:
+            return layouts[0]
+
+        group = 0
+        for i, bit in enumerate(group_led_bits):
+            if led_mask & (1 << bit):
+                group |= (1 << i)
+
+        if group < len(layouts):
+            return layouts[group]
+        return layouts[0]
 
-            for line in result.split("\n"):
-                if line.startswith('layout:'):
-                    layouts = line.split(':')[1].strip().split(',')
-                    self.layouts = layouts
-                    return layouts
+    def layouts_expired(self) -> bool:
+        return (
+            self.layouts_time is None or
+            self.layouts_ttl is not None and time.monotonic() - self.layouts_time > self.layouts_ttl
+        )
+
+    def get_available_layouts(self) -> list[str]:
+        """Getting list of keyboard layouts, it is cached until invalidation"""
+
+        if self.layouts_expired():
+            self.layouts_time = time.monotonic()
+            self.layouts = self.query_layouts()
+        return self.layouts or ["unknown"]
+
+    async def aget_available_layouts(self) -> list[str]:
+        """Getting list of keyboard layouts, it is cached until invalidation"""
+
+        if self.layouts_expired():
+            self.layouts_time = time.monotonic()
+            self.layouts = await self.aquery_layouts()
+        return self.layouts or ["unknown"]
+
+    def invalidate_layouts(self):
+        """Dropping cached layouts, they will be re-read on the next call"""
+
+        self.layouts_time = None
+
+    def query_layouts(self) -> list[str] | None:
+        """Reading list of keyboard layouts from setxkbmap"""
+
+        try:
+            result = check_output(self.layouts_command.split(" "), timeout=self.command_timeout)
+            return parse_layouts(result)
         except Exception as e:
             logger.error(f"Getting layouts error: {e}")
-        
-        return ["unknown"]
+        return None
+
+    async def aquery_layouts(self) -> list[str] | None:
+        """Reading list of keyboard layouts from setxkbmap"""
+
+        try:
+            result = await self.run_command(self.layouts_command)
+            return parse_layouts(result)
+        except Exception as e:
+            logger.error(f"Getting layouts error: {e!r}")
+        return None
 
     def get_led_mask(self) -> int | None:
         """Getting current LED mask"""
         
         try:
-            result = check_output(self.layout_command.split(" ")).decode()
-
-            for line in result.split('\n'):
-                if 'LED mask' in line:
-                    mask_str = line.split('LED mask:')[1].strip()
-                    clean_mask = mask_str.replace(' ', '')
-                    return int(clean_mask, 16)
-                    
+            result = check_output(self.layout_command.split(" "), timeout=self.command_timeout)
+            return parse_led_mask(result)
+        except Exception as e:
+            logger.error(f"Getting LED mask error: {e}")
+        return None
+
+    async def aget_led_mask(self) -> int | None:
+        """Getting current LED mask"""
+
+        try:
+            result = await self.run_command(self.layout_command)
+            return parse_led_mask(result)
+        except Exception as e:
+            logger.error(f"Getting LED mask error: {e!r}")
+        return None
+
+    async def run_command(self, command) -> bytes:
+        """Running command without blocking the event loop, it is killed on timeout"""
+
+        return await asyncio.to_thread(
+            check_output, command.split(" "), stderr=DEVNULL, timeout=self.command_timeout
+        )
+
+
+class _XkbBackend(_SystemBackend):
+    """
+    XKB extension via xcffib:
+    XkbStateNotify/XkbIndicatorStateNotify - for tracking current group, the group is
+    taken from the events, the server is asked only before the first one.
+    _XKB_RULES_NAMES property - for getting current layouts, it is re-read only after
+    XkbNewKeyboardNotify/XkbMapNotify. setxkbmap sets the property after loading the
+    keymap, so the layouts are re-read once more after rules_names_delay seconds.
+    """
+
+    layouts_ttl = None
+    rules_names_delay = 0.5
+
+    def __init__(self, qtile=None):
+        self.xkb = XkbConnection()
+        self.callback = None
+        self._layouts_timer = None
+
+    def get_keyboard(self, group_led_bits=None) -> str:
+        """Detecting current layout by XKB group"""
+
+        layouts = self.get_available_layouts()
+        try:
+            group = self.xkb.group if self.xkb.group is not None else self.xkb.get_group()
+            if group < len(layouts):
+                return layouts[group]
+        except Exception as e:
+            logger.error(f"Layout detecting error: {e}")
+        return layouts[0]
+
+    def query_layouts(self) -> list[str] | None:
+        """Reading list of keyboard layouts from the root window property"""
+
+        try:
+            layout = self.xkb.get_rules_names().get("layout")
+            if layout:
+                return layout.split(",")
+        except Exception as e:
+            logger.error(f"Getting layouts error: {e}")
+        return _SystemBackend.query_layouts(self)
+
+    def get_led_mask(self) -> int | None:
+        """Getting current LED mask"""
+
+        try:
+            return self.xkb.get_indicators()
         except Exception as e:
             logger.error(f"Getting LED mask error: {e}")
-        
         return None
 
+    def subscribe(self, callback):
+        """Calling callback on every change of keyboard state"""
 
-class SystemKeyboardLayout(base.InLoopPollText):
+        self.callback = callback
+        asyncio.get_event_loop().add_reader(self.xkb.fileno(), self._on_events)
+
+    def _on_events(self):
+        try:
+            types = self.xkb.pending_events()
+        except Exception as e:
+            logger.error(f"Reading XKB events error: {e}")
+            return
+        if types & LAYOUT_EVENTS:
+            self.invalidate_layouts()
+            if self._layouts_timer is not None:
+                self._layouts_timer.cancel()
+            self._layouts_timer = asyncio.get_event_loop().call_later(
+                self.rules_names_delay, self._on_rules_names
+            )
+        if self.callback is not None and types & (STATE_EVENTS | LAYOUT_EVENTS):
+            self.callback()
+
+    def _on_rules_names(self):
+        self._layouts_timer = None
+        self.invalidate_layouts()
+        if self.callback is not None:
+            self.callback()
+
+    def finalize(self):
+        if self._layouts_timer is not None:
+            self._layouts_timer.cancel()
+            self._layouts_timer = None
+        if self.callback is not None:
+            asyncio.get_event_loop().remove_reader(self.xkb.fileno())
+            self.callback = None
+        self.xkb.close()
+
+
+system_layout_backends = {
+    "xkb": _XkbBackend,
+    "xset": _SystemBackend,
+}
+
+
+def _create_backend(name):
+    try:
+        return system_layout_backends[name]()
+    except KeyError:
+        logger.error(f"Unknown backend '{name}', using 'xset'")
+    except XkbUnavailable as e:
+        logger.warning(f"XKB backend is not available, using 'xset': {e}")
+    return _SystemBackend()
+
+
+class _KeyboardState:
+    """
+    Process-wide keyboard state shared by all SystemKeyboardLayout widgets.
+
+    There is only one backend (one XKB subscription or one xset poller) and one
+    list of layouts for each backend and group_led_bits, no matter how many bars
+    show the widget. All subscribed widgets are updated in the same pass.
+
+    Polling runs in an asyncio task, xset is awaited as a subprocess and the
+    duration of every poll is collected in poll_stats.
+
+    The polling interval is adaptive: right after a layout change (or boost())
+    it polls every fast_interval seconds during fast_window, and when the user is
+    idle for idle_after seconds or the screen is locked it polls every idle_interval.
+    """
+
+    def __init__(self, backend, group_led_bits):
+        self.group_led_bits = group_led_bits
+        self.backend = _create_backend(backend)
+        self.widgets = []
+        self.update_interval = None
+        self.fast_interval = 0.05
+        self.fast_window = 2
+        self.idle_interval = 5
+        self.idle_after = 30
+        self.fast_until = 0
+        self.poll_stats = {"count": 0, "last": 0.0, "max": 0.0, "total": 0.0}
+        self._task = None
+        self._refresh_tasks = set()
+        self._screensaver = None
+
+        if self.polling:
+            # The first poll is done by the task as soon as a widget subscribes
+            self.keyboard = ""
+        else:
+            self.backend.get_available_layouts()
+            self.keyboard = self.backend.get_keyboard(group_led_bits)
+            self.backend.subscribe(self.refresh)
+
+    @property
+    def polling(self) -> bool:
+        return not isinstance(self.backend, _XkbBackend)
+
+    def subscribe(self, widget):
+        """Adding a widget, it will be updated on every change"""
+
+        if widget in self.widgets:
+            return
+        self.widgets.append(widget)
+        if self.polling:
+            interval = widget.update_interval
+            if interval and (self.update_interval is None or interval < self.update_interval):
+                self.update_interval = interval
+            if self._task is None:
+                self.fast_interval = widget.fast_interval
+                self.fast_window = widget.fast_window
+                self.idle_interval = widget.idle_interval
+                self.idle_after = widget.idle_after
+                self._task = asyncio.create_task(self._poll_loop())
+
+    def unsubscribe(self, widget):
+        """Removing a widget, the state is closed after the last one"""
+
+        if widget in self.widgets:
+            self.widgets.remove(widget)
+        if not self.widgets:
+            self.finalize()
+
+    def reload_layouts(self):
+        """Re-reading list of layouts and updating the widgets"""
+
+        self.backend.invalidate_layouts()
+        self.refresh()
+
+    def boost(self):
+        """Polling fast for a while, e.g. after pressing layout switching keys"""
+
+        if not self.polling:
+            return
+        self.fast_until = time.monotonic() + self.fast_window
+        if self._task is not None:
+            # Interrupting the current sleep
+            self._task.cancel()
+        self._task = asyncio.create_task(self._poll_loop())
+
+    def refresh(self):
+        """Reading current layout once and pushing it to all the widgets"""
+
+        if self.polling:
+            # The loop keeps only weak references to tasks
+            task = asyncio.create_task(self._poll())
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_done)
+            return
+
+        started = time.monotonic()
+        keyboard = self.backend.get_keyboard(self.group_led_bits)
+        self._record_poll(time.monotonic() - started)
+        self._push(keyboard)
+
+    def _refresh_done(self, task):
+        self._refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Keyboard layout refresh error: {task.exception()}")
+
+    async def _poll(self):
+        started = time.monotonic()
+        try:
+            keyboard = await self.backend.aget_keyboard(self.group_led_bits)
+        finally:
+            self._record_poll(time.monotonic() - started)
+        self._push(keyboard)
+
+    async def _poll_loop(self):
+        while self.update_interval:
+            await self._poll()
+            await asyncio.sleep(self._next_interval())
+
+    def _next_interval(self) -> float:
+        if time.monotonic() < self.fast_until:
+            return self.fast_interval
+
+        idle, locked = self._query_screensaver()
+        if locked or idle >= self.idle_after:
+            return max(self.idle_interval, self.update_interval)
+        return self.update_interval
+
+    def _query_screensaver(self) -> tuple[float, bool]:
+        try:
+            if self._screensaver is None:
+                self._screensaver = ScreenSaverInfo()
+            return self._screensaver.query()
+        except Exception as e:
+            logger.warning(f"Getting idle time error: {e}")
+            if self._screensaver is not None:
+                self._screensaver.close()
+                self._screensaver = None
+            # Without the extension it works with constant interval
+            self.idle_after = float("inf")
+            return 0.0, False
+
+    def _record_poll(self, duration):
+        stats = self.poll_stats
+        stats["count"] += 1
+        stats["last"] = duration
+        stats["max"] = max(stats["max"], duration)
+        stats["total"] += duration
+
+    def _push(self, keyboard):
+        if keyboard is None:
+            return
+        if self.polling and self.keyboard and keyboard != self.keyboard:
+            # Layouts are often switched several times in a row
+            self.fast_until = time.monotonic() + self.fast_window
+        self.keyboard = keyboard
+        # The same text is not redrawn by the widget, RenderDiffMixin counts it
+        for widget in self.widgets:
+            widget.update(widget.poll())
+
+    def finalize(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._refresh_tasks:
+            task.cancel()
+        self._refresh_tasks.clear()
+        if self._screensaver is not None:
+            self._screensaver.close()
+            self._screensaver = None
+        if not self.polling:
+            self.backend.finalize()
+        for key, state in list(_keyboard_states.items()):
+            if state is self:
+                del _keyboard_states[key]
+
+
+_keyboard_states: dict[tuple, _KeyboardState] = {}
+
+
+def _get_keyboard_state(backend, group_led_bits) -> _KeyboardState:
+    key = (backend, tuple(group_led_bits))
+    if key not in _keyboard_states:
+        _keyboard_states[key] = _KeyboardState(backend, group_led_bits)
+    return _keyboard_states[key]
+
+
+class SystemKeyboardLayout(RenderDiffMixin, base.InLoopPollText):
     """
     Widget for displaying the current keyboard layout
 
+    All instances of the widget share one keyboard state, so adding monitors
+    does not add pollers. The widget is redrawn only when the layout is changed.
+
     This widget was tested only in X11.
     """
 
     defaults = [
-        ("update_interval", 1, "Update time in seconds."),
+        ("update_interval", 1, "Update time in seconds (only for 'xset' backend)."),
+        (
+            "fast_interval", 0.05,
+            "Update time in seconds right after a layout change or 'boost' command (only for 'xset' backend)."
+        ),
+        ("fast_window", 2, "How long in seconds to poll with 'fast_interval'."),
+        (
+            "idle_interval", 5,
+            "Update time in seconds while the user is idle or the screen is locked (only for 'xset' backend)."
+        ),
+        ("idle_after", 30, "Seconds without user input after which the user is idle."),
         (
             "display_map",
             {},
@@ -141,6 +521,12 @@ class SystemKeyboardLayout(base.InLoopPollText):
             "However, if you use more than two layouts, you shold use more bits."
             "You can detect which bits are used for layouts by run the script 'get_led_mask.py' and switching your layouts."
         ),
+        (
+            "backend", "xkb",
+            "Backend for detecting layout: 'xkb' - XKB events via xcffib, without polling; "
+            "'xset' - polling 'xset -q' every 'update_interval' seconds. "
+            "If 'xkb' is not available the widget falls back to 'xset'."
+        ),
     ]
 
     def __init__(self, **config):
@@ -150,12 +536,42 @@ class SystemKeyboardLayout(base.InLoopPollText):
     def _configure(self, qtile, bar):
         base.InLoopPollText._configure(self, qtile, bar)
 
-        self.system_backend = _SystemBackend()
-        self.system_backend.get_available_layouts()
+        self.keyboard_state = _get_keyboard_state(self.backend, self.group_led_bits)
+        self.keyboard_state.subscribe(self)
+        # The shared state polls (or gets events) and pushes changes to the widget
+        self.update_interval = None
+
+    def finalize(self):
+        self.keyboard_state.unsubscribe(self)
+        base.InLoopPollText.finalize(self)
+
+    @expose_command()
+    def reload_layouts(self):
+        """Re-read the list of layouts, e.g. after running setxkbmap"""
+
+        self.keyboard_state.reload_layouts()
+
+    @expose_command()
+    def boost(self):
+        """
+        Poll fast for 'fast_window' seconds. It is bound to the layout switching keys in
+        config.py for instant feedback with 'xset' backend:
+        Key([mod], "space", lazy.widget["systemkeyboardlayout"].boost())
+        Without the binding the first switch is shown after a full 'update_interval'.
+        """
+
+        self.keyboard_state.boost()
+
+    @expose_command()
+    def poll_stats(self):
+        """Number of polls and their durations in seconds (last, max, avg)"""
 
+        stats = dict(self.keyboard_state.poll_stats)
+        stats["avg"] = stats["total"] / stats["count"] if stats["count"] else 0.0
+        return stats
 
     def poll(self):
-        keyboard = self.system_backend.get_keyboard(self.group_led_bits)
+        keyboard = self.keyboard_state.keyboard
         if keyboard in self.display_map.keys():
             return self.display_map[keyboard]
         return keyboard.upper()
@@ -26,26 +26,34 @@
 
 import os
 import re
-import subprocess
 from pathlib import Path
 
-import libqtile.resources
 from libqtile import layout, qtile, hook
 from libqtile.config import Click, Drag, Group, Key, Match
 from libqtile.lazy import lazy
 from libqtile.log_utils import logger
-from libqtile.utils import guess_terminal
 from libqtile.widget import backlight
 
 # from widgets.system_keyboard_layouts import SystemKeyboardLayout
-from custom_utils.screens import configure_monitors, setup_screens
+from custom_utils.autostart import AutostartManager, Service, selection_owned
+from custom_utils.hotplug import ScreenChangeHandler
+from custom_utils.logs import log_to_qtile
+from custom_utils.profiling import add_command, startup_profiler
+from custom_utils.screens import (
+    configure_monitors, monitor_layout_command, setup_screens
+)
+from custom_utils.terminal import cached_terminal
+
+startup_profiler.mark("config: imports")
+# Modules shared with the scripts log by their own names
+log_to_qtile(logger)
 
 mod = "mod4"
-terminal = guess_terminal()
+# guess_terminal() scans PATH, the result is cached in ~/.cache/qtile/terminal
+terminal = cached_terminal()
 home = Path.home()
 qtile_config = Path(home, ".config/qtile")
 scripts_dir = Path(qtile_config, "scripts")
-autostart = Path(qtile_config, "autostart.sh")
 
 os.environ["QT_QPA_PLATFORMTHEME"] = "qt6ct"
 
@@ -55,6 +63,9 @@ def patch_qtile_bug():
         from libqtile.backend.x11 import core as x11_core
 
         original_handle_DestroyNotify = x11_core.Core.handle_DestroyNotify
+        if getattr(original_handle_DestroyNotify, "patched", False):
+            # Already applied by the previous config load, reload must not wrap it again
+            return
 
         def patched_handle_DestroyNotify(self, event):
             try:
@@ -65,6 +76,7 @@ def patch_qtile_bug():
                     return
                 raise
 
+        patched_handle_DestroyNotify.patched = True
         x11_core.Core.handle_DestroyNotify = patched_handle_DestroyNotify
         logger.info("Applied Qtile bug patch")
     except Exception as e:
@@ -73,24 +85,82 @@ def patch_qtile_bug():
 # Apply
 patch_qtile_bug()
 
+def reload_keyboard_layouts():
+    """Keyboard widget reads layouts again after setxkbmap."""
+    keyboard = qtile.widgets_map.get("systemkeyboardlayout")
+    if keyboard is not None:
+        keyboard.reload_layouts()
+
+# Started concurrently, a service waits only for the services in its 'after'
+SERVICES = [
+    Service(
+        "setxkbmap",
+        ["setxkbmap", "-layout", "us,ru", "-option", "grp:win_space_toggle"],
+        oneshot=True,
+        on_ready=reload_keyboard_layouts,
+    ),
+    Service("nm-applet", ["nm-applet"], restart=True),
+    Service("blueman-applet", ["blueman-applet"], restart=True),
+    # Without --daemon to be restarted when it crashes
+    Service("picom", ["picom"], ready=selection_owned("_NET_WM_CM_S0"), restart=True),
+    # Pre-scaled per monitor and cached, see custom_utils/wallpaper.py
+    Service("wallpaper", [f"{scripts_dir}/set_wallpaper.py"], after=("picom",), oneshot=True),
+    # Supervisor of RDP sessions started by mod+d
+    Service("rdp-connector", [f"{scripts_dir}/rdp_connector.py", "--daemon"], restart=True),
+    Service(
+        "light-locker",
+        ["light-locker", "--lock-on-suspend", "--lock-on-lid", "--lock-after-screensaver=60"],
+        restart=True,
+    ),
+]
+
+autostart_manager = AutostartManager(SERVICES)
+
 @hook.subscribe.startup_once
 def autostart_once():
-    home = os.path.expanduser("~")
-    subprocess.run(os.path.join(home, ".config", "qtile", "autostart.sh"))
+    """Starting services without blocking qtile, timings are in 'startup_timings'."""
+    # A config reload rebinds autostart_manager to a new one, which is never started
+    manager = autostart_manager
+    manager.start()
+    add_command(qtile, "autostart_status", lambda _: manager.status())
 
 @hook.subscribe.startup
 def startup():
     """Startup func."""
-    configure_monitors()
+    startup_profiler.mark("hook: startup")
+    add_command(qtile, "startup_timings", lambda _: startup_profiler.report())
+    with startup_profiler.phase("hook: configure_monitors"):
+        configure_monitors()
+
+@hook.subscribe.startup_complete
+def startup_complete():
+    """Qtile is ready, saving startup timings."""
+    startup_profiler.mark("hook: startup_complete")
+    startup_profiler.save()
+
+def update_screens():
+    """Adding bars only for new monitors and reconfiguring screens."""
+
+    qtile.config.screens = setup_screens(reuse=True)
+    qtile.cmd_reconfigure_screens()
+    # A new monitor gets the wallpaper scaled to its resolution
+    qtile.spawn([f"{scripts_dir}/set_wallpaper.py"])
+
+# A config reload re-executes config.py in the same namespace, the pending run
+# of the previous handler must not reconfigure the screens of the new config
+_previous_handler = globals().get("screen_change_handler")
+if _previous_handler is not None:
+    _previous_handler.cancel()
+del _previous_handler
+# Coalesces bursts of events, applies xrandr layout and waits for RandR
+# instead of sleeping, so the event loop is never blocked
+screen_change_handler = ScreenChangeHandler(monitor_layout_command, update_screens)
 
 @hook.subscribe.screen_change
 def on_screen_change(event):
     """Running when a monitor plugged/unplugged."""
 
-    configure_monitors()
-    import time
-    time.sleep(1)
-    qtile.cmd_reconfigure_screens()
+    screen_change_handler(event)
 
 @hook.subscribe.screens_reconfigured
 def after_screens_reconfigured():
@@ -152,6 +222,10 @@ keys = [
     Key([], "XF86AudioLowerVolume", lazy.spawn("wpctl set-volume @DEFAULT_AUDIO_SINK@ 5%-")),
     Key([], "XF86AudioRaiseVolume", lazy.spawn("wpctl set-volume @DEFAULT_AUDIO_SINK@ 5%+")),
     Key([], "XF86AudioMute", lazy.spawn("wpctl set-mute @DEFAULT_AUDIO_SINK@ toggle")),
+
+    # Layouts are switched by XKB (grp:win_space_toggle) in spite of the grab, the key
+    # only makes the keyboard widget poll fast with 'xset' backend
+    Key([mod], "space", lazy.widget["systemkeyboardlayout"].boost(), desc="Show the switched layout at once"),
   
     # Tools
     Key([mod], "Return", lazy.spawn(terminal), desc="Launch terminal"),
@@ -163,6 +237,7 @@ keys = [
     Key([mod, "control"], 39, lazy.spawn(f"{scripts_dir}/rofi_vm_launcher.sh"), desc="Start rofi menu (mod+csstrl+s)"),
     # Connect to ... via rdp
     Key([mod], 40, lazy.spawn(f"{str(scripts_dir)}/rdp_connector.py"), desc="Run xfreerdp3 connect menu, (mod+d)"),
+    Key([mod, "shift"], 40, lazy.spawn(f"{scripts_dir}/rdp_connector.py sessions"), desc="Kill or reconnect RDP session (mod+shift+d)"),
 
     # Qtile management
     Key([mod, "control"], 27, lazy.reload_config(), desc="Reload the config (mod+ctrl+r)"),
@@ -248,9 +323,8 @@ widget_defaults = dict(
 )
 extension_defaults = widget_defaults.copy()
 
-logo = os.path.join(os.path.dirname(libqtile.resources.__file__), "logo.png")
-
-screens = setup_screens()
+with startup_profiler.phase("config: setup_screens"):
+    screens = setup_screens()
 
 # Drag floating layouts.
 mouse = [
@@ -283,7 +357,8 @@ floating_layout = layout.Floating(
 auto_fullscreen = True
 focus_on_window_activation = "smart"
 focus_previous_on_window_remove = False
-reconfigure_screens = True
+# Screens are reconfigured only by screen_change_handler, once per settled change
+reconfigure_screens = False
 
 # If things like steam games want to auto-minimize themselves when losing
 # focus, should we respect this or not?
@@ -305,3 +380,5 @@ wl_xcursor_size = 24
 # We choose LG3D to maximize irony: it is a 3D non-reparenting WM written in
 # java that happens to be on java's whitelist.
 wmname = "LG3D"
+
+startup_profiler.mark("config: loaded")
@@ -0,0 +1,189 @@
+"""
+Autostart of programs without blocking qtile's event loop.
+
+Services are declared in config.py as a list of Service. All of them are started
+concurrently, a service waits only for the services listed in its 'after'. A
+service is ready when:
+    oneshot - the command exits with code 0 (e.g. setxkbmap)
+    daemon  - its 'ready' check returns True (e.g. the compositor owns its selection),
+              without the check - as soon as the process is started
+
+Oneshots are run by subprocess.run in a thread, not as asyncio subprocesses: qtile's
+SIGCHLD handler reaps children before asyncio does, and asyncio then reports exit
+code 255 for them. subprocess takes an already reaped child as exited with 0.
+Daemons are asyncio subprocesses, only their exit codes in the log may be wrong.
+
+Daemons with 'restart' are restarted when they crash. Start and ready times of every
+service are recorded by the startup profiler.
+
+"""
+
+import asyncio
+import subprocess
+from typing import Callable, NamedTuple
+
+import xcffib
+from libqtile.log_utils import logger
+
+from custom_utils.profiling import startup_profiler
+
+
+class Service(NamedTuple):
+    name: str
+    command: list[str]
+    # Names of services which must be ready before starting this one
+    after: tuple[str, ...] = ()
+    # Runs to completion instead of staying in background
+    oneshot: bool = False
+    # Readiness check of a daemon, it is called until it returns True
+    ready: Callable[[], bool] | None = None
+    ready_timeout: float = 5
+    restart: bool = False
+    max_restarts: int = 3
+    # Called when the service is ready
+    on_ready: Callable[[], None] | None = None
+
+
+def selection_owned(selection) -> Callable[[], bool]:
+    """Readiness check: some client owns X selection, e.g. '_NET_WM_CM_S0' of compositor"""
+
+    def check() -> bool:
+        # A connection per check, none is left open when the service is not ready in time
+        conn = xcffib.connect()
+        try:
+            atom = conn.core.InternAtom(False, len(selection), selection).reply().atom
+            return conn.core.GetSelectionOwner(atom).reply().owner != xcffib.NONE
+        finally:
+            conn.disconnect()
+
+    return check
+
+
+class AutostartManager:
+    """Starting services by dependencies and supervising daemons"""
+
+    def __init__(self, services, poll_interval=0.05, restart_delay=1):
+        self.services = {service.name: service for service in services}
+        self.poll_interval = poll_interval
+        self.restart_delay = restart_delay
+        self.processes = {}
+        # {name: "starting", "ready", "failed", "exited" or "skipped"}
+        self.states = {}
+        self.restarts = {}
+        self._ready = {}
+        self._tasks = []
+
+        for service in services:
+            unknown = set(service.after) - set(self.services)
+            if unknown:
+                raise ValueError(f"Service {service.name} depends on unknown {', '.join(unknown)}")
+
+    def start(self):
+        """Scheduling all the services, it returns immediately"""
+
+        loop = asyncio.get_event_loop()
+        self._ready = {name: loop.create_future() for name in self.services}
+        for service in self.services.values():
+            self._tasks.append(loop.create_task(self._run(service)))
+
+    async def _run(self, service):
+        for name in service.after:
+            if not await self._ready[name]:
+                logger.warning(f"Autostart: {service.name} is skipped, {name} is not ready")
+                self.states[service.name] = "skipped"
+                self._set_ready(service, False)
+                return
+
+        start = startup_profiler.now()
+        self.states[service.name] = "starting"
+        try:
+            ready = await self._start(service)
+        except Exception as e:
+            logger.error(f"Autostart: {service.name} failed: {e}")
+            ready = False
+        self.states[service.name] = "ready" if ready else "failed"
+        startup_profiler.record(f"autostart: {service.name}", start, startup_profiler.now() - start)
+        self._set_ready(service, ready)
+
+        if ready and service.on_ready is not None:
+            try:
+                service.on_ready()
+            except Exception as e:
+                logger.error(f"Autostart: on_ready of {service.name} failed: {e}")
+
+        if not service.oneshot and service.name in self.processes:
+            await self._supervise(service)
+
+    async def _start(self, service) -> bool:
+        if service.oneshot:
+            # The command is killed on the timeout and TimeoutExpired is raised
+            result = await asyncio.to_thread(
+                subprocess.run,
+                service.command,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=service.ready_timeout,
+            )
+            return result.returncode == 0
+
+        process = await asyncio.create_subprocess_exec(
+            *service.command,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self.processes[service.name] = process
+        if service.ready is None:
+            return True
+        return await self._wait_ready(service, process)
+
+    async def _wait_ready(self, service, process) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + service.ready_timeout
+        while loop.time() < deadline:
+            if process.returncode is not None:
+                return False
+            try:
+                if service.ready():
+                    return True
+            except Exception as e:
+                logger.warning(f"Autostart: readiness check of {service.name} failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+        logger.warning(f"Autostart: {service.name} is not ready in {service.ready_timeout} s")
+        return False
+
+    async def _supervise(self, service):
+        while True:
+            returncode = await self.processes[service.name].wait()
+            self.states[service.name] = "exited"
+            restarts = self.restarts.get(service.name, 0)
+            if not service.restart or restarts >= service.max_restarts:
+                logger.warning(f"Autostart: {service.name} exited with code {returncode}")
+                return
+
+            logger.warning(f"Autostart: {service.name} exited with code {returncode}, restarting")
+            self.restarts[service.name] = restarts + 1
+            await asyncio.sleep(self.restart_delay)
+            try:
+                if not await self._start(service):
+                    return
+            except Exception as e:
+                logger.error(f"Autostart: restarting {service.name} failed: {e}")
+                return
+            self.states[service.name] = "ready"
+
+    def _set_ready(self, service, ready):
+        if not self._ready[service.name].done():
+            self._ready[service.name].set_result(ready)
+
+    def status(self) -> dict:
+        """States, pids and restarts of the services"""
+
+        return {
+            name: {
+                "state": self.states.get(name, "waiting"),
+                "pid": self.processes[name].pid if name in self.processes else None,
+                "restarts": self.restarts.get(name, 0),
+            }
+            for name in self.services
+        }
+
@@ -0,0 +1,108 @@
+"""
+Handling of monitor hot-plug without blocking qtile's event loop.
+
+A burst of screen_change events (e.g. a dock flapping) is coalesced into one run:
+the layout command is run as an asyncio subprocess, then the handler waits for
+RRScreenChangeNotify of the new configuration (instead of a fixed sleep) and
+reconfigures qtile's screens once.
+
+screen_change caused by the handler's own xrandr call is recognized by RandR
+timestamps and ignored. The screens are reconfigured even if the layout could not
+be applied, so a new monitor still gets a bar.
+
+The config must set reconfigure_screens = False, otherwise qtile reconfigures the
+screens on every raw screen_change as well, including the ones of our xrandr call.
+The handler of the previous config is cancelled on a config reload.
+
+"""
+
+import asyncio
+
+from libqtile.log_utils import logger
+
+from custom_utils import monitors
+
+
+class ScreenChangeHandler:
+    """Debounced pipeline: layout command -> wait for RandR -> reconfigure"""
+
+    def __init__(self, layout_command, reconfigure, debounce=0.3, settle_timeout=2):
+        """
+        layout_command - function returning xrandr command for connected monitors
+        or None if nothing should be changed.
+        reconfigure - function reconfiguring qtile's screens.
+        """
+
+        self.layout_command = layout_command
+        self.reconfigure = reconfigure
+        self.debounce = debounce
+        self.settle_timeout = settle_timeout
+        self._timer = None
+        self._task = None
+        self._rerun = False
+        self._applied_timestamps = None
+
+    def __call__(self, event=None):
+        """Scheduling the pipeline, it is postponed by every new event"""
+
+        if self._task is not None:
+            # The configuration is being applied, check again after it
+            self._rerun = True
+            return
+
+        loop = asyncio.get_event_loop()
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(self.debounce, self._start)
+
+    def cancel(self):
+        """Dropping the pending run, e.g. of the handler of the previous config"""
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._task is not None:
+            self._task.cancel()
+        self._rerun = False
+
+    def _start(self):
+        self._timer = None
+        timestamps = monitors.get_timestamps()
+        if timestamps is not None and timestamps == self._applied_timestamps:
+            # It is our own change, screens are already reconfigured
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            try:
+                await self._apply_layout()
+            except Exception as e:
+                logger.error(f"Error applying monitor layout: {e}")
+            monitors.invalidate()
+            self._applied_timestamps = monitors.get_timestamps()
+            self.reconfigure()
+        except Exception as e:
+            logger.error(f"Error handling screen change: {e}")
+        finally:
+            self._task = None
+            if self._rerun:
+                self._rerun = False
+                self()
+
+    async def _apply_layout(self):
+        monitors.invalidate()
+        command = self.layout_command()
+        if command:
+            monitors.drain_events()
+            await self._apply(command)
+            if not await monitors.wait_for_screen_change(self.settle_timeout):
+                logger.info("No RandR screen change after applying the layout")
+
+    async def _apply(self, command):
+        process = await asyncio.create_subprocess_exec(*command)
+        try:
+            await asyncio.wait_for(process.wait(), self.settle_timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            raise
@@ -0,0 +1,41 @@
+"""
+Logging of the modules shared by qtile and the standalone scripts.
+
+The modules log by their own names (logging.getLogger(__name__)), so the scripts do
+not import libqtile. In qtile the "custom_utils" logger gets the handlers of qtile's
+log, the scripts are started with stderr sent to /dev/null, so they write their own
+log next to qtile's one, e.g. ~/.local/share/qtile/rdp_connector.log.
+
+"""
+
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+LOG_DIR = Path(os.environ.get("XDG_DATA_HOME", Path(Path.home(), ".local/share")), "qtile")
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def log_to_qtile(qtile_logger):
+    """Sending logs of the shared modules to qtile's log"""
+
+    shared_logger = logging.getLogger("custom_utils")
+    # A config reload must not add the handlers again
+    if shared_logger.handlers:
+        return
+    shared_logger.setLevel(qtile_logger.level)
+    for handler in qtile_logger.handlers:
+        shared_logger.addHandler(handler)
+
+
+def log_to_file(name, level=logging.INFO):
+    """Logging of a script to LOG_DIR/<name>.log"""
+
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(Path(LOG_DIR, f"{name}.log"), maxBytes=1 << 20, backupCount=1)
+    except OSError:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.basicConfig(level=level, handlers=[handler])
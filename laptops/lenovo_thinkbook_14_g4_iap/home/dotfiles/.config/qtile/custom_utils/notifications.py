@@ -0,0 +1,125 @@
+"""
+Desktop notifications via org.freedesktop.Notifications over D-Bus.
+
+One connection to the session bus is kept open, and a notification sent with a key
+replaces the previous notification with the same key, e.g. "Connecting to..." is
+updated in place to "Connected" instead of stacking popups.
+
+If dbus_fast is not installed or D-Bus fails, dunstify is used: arguments are passed
+as a list (no shell quoting) and its -p/-r options do the same replacing.
+
+The bus address can be given explicitly, e.g. of a private bus with a fake
+notification daemon.
+
+"""
+
+import asyncio
+import html
+import logging
+
+try:
+    from dbus_fast import Message, MessageType, Variant
+    from dbus_fast.aio import MessageBus
+except ImportError:
+    MessageBus = None
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_NAME = "org.freedesktop.Notifications"
+NOTIFICATIONS_PATH = "/org/freedesktop/Notifications"
+
+URGENCIES = {"low": 0, "normal": 1, "critical": 2}
+
+
+class Notifier:
+    """Sending notifications, D-Bus with dunstify fallback"""
+
+    def __init__(self, app_name, bus_address=None, timeout=-1):
+        self.app_name = app_name
+        self.bus_address = bus_address
+        # Milliseconds, -1 is the server's default
+        self.timeout = timeout
+        self.bus = None
+        self.body_markup = False
+        self.use_dbus = MessageBus is not None
+        # {key: notification id}
+        self.ids = {}
+
+    async def notify(self, summary, body, urgency="normal", key=None) -> int | None:
+        """Sending a notification, returns its id"""
+
+        replaces_id = self.ids.get(key, 0) if key is not None else 0
+        notification_id = None
+        if self.use_dbus:
+            try:
+                notification_id = await self._notify_dbus(summary, body, urgency, replaces_id)
+            except Exception as e:
+                logger.warning(f"D-Bus notification error, falling back to dunstify: {e}")
+                self.use_dbus = False
+                self.close()
+        if not self.use_dbus:
+            notification_id = await self._notify_dunstify(summary, body, urgency, replaces_id)
+
+        if key is not None and notification_id:
+            self.ids[key] = notification_id
+        return notification_id
+
+    async def _call(self, member, signature="", body=()):
+        reply = await self.bus.call(Message(
+            destination=NOTIFICATIONS_NAME,
+            path=NOTIFICATIONS_PATH,
+            interface=NOTIFICATIONS_NAME,
+            member=member,
+            signature=signature,
+            body=list(body),
+        ))
+        if reply.message_type == MessageType.ERROR:
+            raise RuntimeError(f"{reply.error_name}: {reply.body}")
+        return reply.body
+
+    async def _connect(self):
+        self.bus = await MessageBus(bus_address=self.bus_address).connect()
+        capabilities, = await self._call("GetCapabilities")
+        self.body_markup = "body-markup" in capabilities
+
+    async def _notify_dbus(self, summary, body, urgency, replaces_id) -> int:
+        if self.bus is None:
+            await self._connect()
+        if self.body_markup:
+            body = html.escape(body, quote=False)
+        notification_id, = await self._call(
+            "Notify",
+            "susssasa{sv}i",
+            (
+                self.app_name, replaces_id, "", summary, body, [],
+                {"urgency": Variant("y", URGENCIES[urgency])},
+                self.timeout,
+            ),
+        )
+        return notification_id
+
+    async def _notify_dunstify(self, summary, body, urgency, replaces_id) -> int | None:
+        command = ["dunstify", "-p", "-a", self.app_name, "-u", urgency]
+        if replaces_id:
+            command += ["-r", str(replaces_id)]
+        if self.timeout >= 0:
+            command += ["-t", str(self.timeout)]
+        try:
+            process = await asyncio.create_subprocess_exec(
+                # dunst interprets backslash escapes
+                *command, summary, body.replace("\\", "\\\\"),
+                stdout=asyncio.subprocess.PIPE,
+            )
+            stdout, _ = await process.communicate()
+        except OSError as e:
+            logger.error(f"dunstify error: {e}")
+            return None
+        try:
+            return int(stdout)
+        except ValueError:
+            return None
+
+    def close(self):
+        if self.bus is not None:
+            self.bus.disconnect()
+            self.bus = None
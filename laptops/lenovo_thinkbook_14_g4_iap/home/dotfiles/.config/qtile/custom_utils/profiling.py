@@ -0,0 +1,101 @@
+"""
+Startup timings: phases of config load, qtile hooks and autostart services.
+
+Times are in milliseconds since qtile process was started (it is started by LightDM
+right after login), so the report shows when the desktop became usable and which
+step delayed it. Every timing is written to qtile's log, the whole report - to
+~/.cache/qtile/startup_timings.json, and it is returned by a qtile command:
+
+    qtile cmd-obj -o root -f startup_timings
+
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+
+from libqtile.log_utils import logger
+
+TIMINGS_FILE = Path(
+    os.environ.get("XDG_CACHE_HOME", Path(Path.home(), ".cache")), "qtile/startup_timings.json"
+)
+
+
+def process_start_time() -> float:
+    """Start of the current process in CLOCK_BOOTTIME seconds"""
+
+    with open("/proc/self/stat") as f:
+        # The command name in parentheses can contain spaces
+        fields = f.read().rsplit(")", 1)[1].split()
+    return int(fields[19]) / os.sysconf("SC_CLK_TCK")
+
+
+class StartupProfiler:
+    """Collecting timings of startup, they are kept between config reloads"""
+
+    def __init__(self):
+        try:
+            self.origin = process_start_time()
+        except (OSError, ValueError, IndexError):
+            self.origin = time.clock_gettime(time.CLOCK_BOOTTIME)
+        # {name: (start, duration)} in milliseconds, a reload overwrites its phases
+        self.timings = {}
+
+    def now(self) -> float:
+        return (time.clock_gettime(time.CLOCK_BOOTTIME) - self.origin) * 1000
+
+    def record(self, name, start, duration=0.0):
+        self.timings[name] = (round(start, 1), round(duration, 1))
+        logger.info(f"Startup timing: {name} at {start:.1f} ms took {duration:.1f} ms")
+
+    def mark(self, name):
+        """Recording a moment, e.g. a hook call"""
+
+        self.record(name, self.now())
+
+    @contextmanager
+    def phase(self, name):
+        """Recording the duration of the block"""
+
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.record(name, start, self.now() - start)
+
+    def report(self) -> dict:
+        return {
+            name: {"start_ms": start, "duration_ms": duration}
+            for name, (start, duration) in self.timings.items()
+        }
+
+    def save(self, path=TIMINGS_FILE):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(self.report(), indent=4))
+        except OSError as e:
+            logger.warning(f"Saving startup timings error: {e}")
+
+
+def add_command(obj, name, func):
+    """Exposing func(obj, *args) as a command of a command object, e.g. qtile"""
+
+    commands = getattr(type(obj), "_commands", None)
+    if isinstance(commands, dict):
+        # Commands which are not bound methods get the object as the first argument
+        commands[name] = func
+    else:
+        # Old qtile finds 'cmd_' methods
+        setattr(obj, f"cmd_{name}", partial(func, obj))
+
+
+# A config reload re-executes the module in the same namespace (importlib.reload),
+# the timings of the login are moved to the new profiler
+_previous_profiler = globals().get("startup_profiler")
+startup_profiler = StartupProfiler()
+if _previous_profiler is not None:
+    startup_profiler.timings.update(_previous_profiler.timings)
+del _previous_profiler
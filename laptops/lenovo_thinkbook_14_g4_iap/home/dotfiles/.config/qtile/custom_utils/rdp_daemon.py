@@ -0,0 +1,312 @@
+"""
+RDP sessions supervisor listening on a Unix socket.
+
+The rofi front-end (scripts/rdp_connector.py) hands a connection to the daemon and
+exits, so there is one long-lived process for all the xfreerdp3 sessions instead of
+a sleeping Python process per session. The daemon notifies about state changes and
+lists, kills and reconnects sessions. Before starting the client the host is probed
+by TCP, so a dead host is reported at once instead of after xfreerdp3 timeouts. The
+probe takes /port: into account and is skipped for a host behind a gateway.
+
+Passwords are looked up in the Secret Service for the front-end and kept in the
+daemon's memory for a while, see custom_utils/secret_store.py. A connection's
+"stdin" is written to the client, so the password is passed by /from-stdin and is
+not on the command line. A password typed by the user is stored in the keyring
+once the session is connected ("remember_password"). After a failed session the
+keyring's password is not given out, so the user is asked again and the new
+password replaces it. The credentials are dropped once the client exits, reconnect
+looks the password up again.
+
+The protocol is one JSON object per line, a request gets one response:
+    {"command": "connect", "connection": {"name": ..., "command": [...], ...}}
+    {"command": "password", "username": ..., "ip_address": ...}
+    {"command": "list"}
+    {"command": "kill", "name": ...}
+    {"command": "reconnect", "name": ...}
+Responses are {"ok": true, ...} or {"ok": false, "error": ...}.
+
+The socket is in $XDG_RUNTIME_DIR or, without it, in a directory in /tmp. Both the
+daemon and the clients refuse a directory which is not owned by the user or is
+accessible by others, so no other user can take the socket and get passwords.
+
+"""
+
+import asyncio
+import json
+import os
+import stat
+import tempfile
+import time
+from pathlib import Path
+
+from custom_utils.secret_store import SecretStore
+from custom_utils.tcp_probe import probe, probe_address
+
+SOCKET_PATH = Path(
+    os.environ.get("XDG_RUNTIME_DIR") or Path(tempfile.gettempdir(), f"rdp_connector-{os.getuid()}"),
+    "rdp_connector.sock",
+)
+
+
+def check_socket_dir(directory):
+    """Creating the directory of the socket for the user only, a foreign one is refused"""
+
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = directory.lstat()
+    if (
+        not stat.S_ISDIR(info.st_mode) or
+        info.st_uid != os.getuid() or
+        info.st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+    ):
+        raise PermissionError(f"{directory} must be a directory of the user with mode 0700")
+
+
+def secret_attributes(username, ip_address) -> dict[str, str]:
+    """Attributes of a password in the keyring, as for secret-tool"""
+
+    return {"protocol": "rdp", "server": ip_address, "user": username}
+
+
+def credentials_input(username, password, params) -> str:
+    """Answers to the prompts of xfreerdp3 /from-stdin: the domain if it is not known, the password"""
+
+    domain_known = "\\" in username or any(param.startswith("/d:") for param in params)
+    return f"{password}\n" if domain_known else f"\n{password}\n"
+
+
+class RdpSession:
+    """xfreerdp3 process of a connection"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.name = connection["name"]
+        self.process = None
+        # connecting, connected, closed, failed, lost, killed, unreachable or error
+        self.state = "connecting"
+        self.started = None
+        self.killed = False
+        self.task = None
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "ip_address": self.connection.get("ip_address"),
+            "username": self.connection.get("username"),
+            "state": self.state,
+            "pid": self.process.pid if self.process else None,
+            "uptime": round(time.monotonic() - self.started) if self.started else None,
+        }
+
+
+class SessionSupervisor:
+    """Starting and watching xfreerdp3 processes"""
+
+    def __init__(
+            self, notify, closed_exit_codes=(0, 12), lost_exit_codes=(147,), time_out=2,
+            probe_timeout=1, secrets=None
+    ):
+        """
+        notify - coroutine function notify(notification_type, message, key).
+        closed_exit_codes - exit codes of xfreerdp3 meaning normal closing.
+        time_out - seconds after which a running client is considered connected.
+        probe_timeout - seconds to wait for TCP connect to the host, None to skip the probe.
+        secrets - SecretStore of passwords, None to use the session's Secret Service.
+        """
+
+        self.notify = notify
+        self.closed_exit_codes = closed_exit_codes
+        self.lost_exit_codes = lost_exit_codes
+        self.time_out = time_out
+        self.probe_timeout = probe_timeout
+        self.secrets = secrets or SecretStore()
+        self.sessions = {}
+
+    async def connect(self, connection) -> dict:
+        session = self.sessions.get(connection["name"])
+        if session is not None and (
+            session.state == "connecting" or
+            session.process and session.process.returncode is None
+        ):
+            raise ValueError(f"{session.name} is already running")
+
+        session = RdpSession(connection)
+        self.sessions[session.name] = session
+        session.task = asyncio.create_task(self._run(session))
+        return session.info()
+
+    async def _run(self, session):
+        try:
+            await self._supervise(session)
+        finally:
+            # The password is not kept longer than in the secret store's cache
+            for key in ("stdin", "password", "remember_password"):
+                session.connection.pop(key, None)
+
+    async def _supervise(self, session):
+        connection = session.connection
+        description = f"{session.name} - {connection.get('ip_address')}"
+        await self.notify(
+            "connecting", f"{description} as {connection.get('username')}", session.name
+        )
+        address = connection.get("ip_address")
+        if address:
+            address = probe_address(address, connection["command"])
+        if self.probe_timeout and address:
+            if await probe(address, self.probe_timeout) is None:
+                session.state = "unreachable"
+                await self.notify("unreachable", description, session.name)
+                return
+
+        stdin = connection.get("stdin")
+        try:
+            session.process = await asyncio.create_subprocess_exec(
+                *connection["command"],
+                stdin=asyncio.subprocess.PIPE if stdin else asyncio.subprocess.DEVNULL,
+            )
+        except OSError:
+            session.state = "error"
+            await self.notify("error", description, session.name)
+            return
+        session.started = time.monotonic()
+        if stdin:
+            session.process.stdin.write(stdin.encode())
+            await session.process.stdin.drain()
+            session.process.stdin.close()
+
+        try:
+            exit_code = await asyncio.wait_for(session.process.wait(), self.time_out)
+        except asyncio.TimeoutError:
+            session.state = "connected"
+            await self.notify("successful", description, session.name)
+            if connection.get("remember_password"):
+                # The password was accepted, it is not asked next time
+                connection["remember_password"] = False
+                await self.secrets.store(
+                    secret_attributes(connection["username"], connection["ip_address"]),
+                    f"RDP {connection['username']}@{connection['ip_address']}",
+                    connection["password"],
+                )
+            exit_code = await session.process.wait()
+
+        if session.killed or exit_code in self.closed_exit_codes:
+            session.state = "killed" if session.killed else "closed"
+            await self.notify("closed", description, session.name)
+        elif exit_code in self.lost_exit_codes:
+            session.state = "lost"
+            await self.notify("lost", description, session.name)
+        else:
+            session.state = "failed"
+            await self.notify("failed", description, session.name)
+            if connection.get("username") and connection.get("ip_address"):
+                # It may be a wrong password, the user is asked for a new one next time
+                self.secrets.reject(secret_attributes(connection["username"], connection["ip_address"]))
+
+    def list(self) -> list[dict]:
+        return [session.info() for session in self.sessions.values()]
+
+    def _get(self, name) -> RdpSession:
+        if name not in self.sessions:
+            raise ValueError(f"No session {name}")
+        return self.sessions[name]
+
+    async def kill(self, name) -> dict:
+        session = self._get(name)
+        if session.process and session.process.returncode is None:
+            session.killed = True
+            session.process.terminate()
+            await session.task
+        return session.info()
+
+    async def reconnect(self, name) -> dict:
+        session = self._get(name)
+        await self.kill(name)
+        connection = session.connection
+        if "stdin" not in connection:
+            password = await self.password(connection["username"], connection["ip_address"])
+            if password is None:
+                raise ValueError(f"No password for {name}, connect from the menu")
+            connection = {
+                **connection,
+                "stdin": credentials_input(connection["username"], password, connection["command"]),
+            }
+        return await self.connect(connection)
+
+    async def password(self, username, ip_address) -> str | None:
+        return await self.secrets.lookup(secret_attributes(username, ip_address))
+
+    async def handle(self, request) -> dict:
+        command = request.get("command")
+        if command == "connect":
+            return {"ok": True, "session": await self.connect(request["connection"])}
+        if command == "password":
+            return {
+                "ok": True,
+                "password": await self.password(request["username"], request["ip_address"]),
+            }
+        if command == "list":
+            return {"ok": True, "sessions": self.list()}
+        if command == "kill":
+            return {"ok": True, "session": await self.kill(request["name"])}
+        if command == "reconnect":
+            return {"ok": True, "session": await self.reconnect(request["name"])}
+        raise ValueError(f"Unknown command {command}")
+
+    async def _on_client(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=SOCKET_PATH):
+        """Serving requests until the process is stopped"""
+
+        check_socket_dir(socket_path.parent)
+        if socket_path.exists():
+            if await is_running(socket_path):
+                raise RuntimeError(f"Daemon is already running on {socket_path}")
+            socket_path.unlink()
+
+        # Connections carry passwords, the socket is only for the user
+        old_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._on_client, path=str(socket_path))
+        finally:
+            os.umask(old_umask)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+async def request(message, socket_path=SOCKET_PATH, timeout=5) -> dict:
+    """Sending one request to the daemon"""
+
+    check_socket_dir(socket_path.parent)
+    reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(str(socket_path)), timeout)
+    try:
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    finally:
+        writer.close()
+    if not line:
+        raise ConnectionError("Daemon closed the connection")
+    return json.loads(line)
+
+
+async def is_running(socket_path=SOCKET_PATH) -> bool:
+    try:
+        await request({"command": "list"}, socket_path, timeout=1)
+    except PermissionError:
+        # A foreign socket directory is an error, not a stopped daemon
+        raise
+    except (OSError, asyncio.TimeoutError, ValueError):
+        return False
+    return True
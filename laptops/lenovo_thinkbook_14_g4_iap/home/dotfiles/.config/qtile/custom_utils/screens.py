@@ -3,7 +3,8 @@ These functions help to work with two monitors.
 When second was plugged it becomes available immediately.
 
 These functions were tested only with laptops with one extra plugged monitor.
-If you use desktop PC with two monitors probably you should make some extra changes.
+If you use desktop PC with two monitors, describe the layout in monitor profiles
+(see custom_utils/monitor_profiles.py).
 
 
 Author: kirill-chu <nefka2006@yandex.ru>
@@ -16,6 +17,8 @@ from pathlib import Path
 from libqtile import bar, widget
 from libqtile.config import Screen
 
+from custom_utils import monitor_profiles, monitors
+from custom_utils.bars import BarBuilder, WidgetSpec
 from widgets.system_keyboard_layouts import SystemKeyboardLayout
 
 DATE_FORMAT = "%d-%m-%Y %a %H:%M"
@@ -23,205 +26,156 @@ DATE_FORMAT = "%d-%m-%Y %a %H:%M"
 home = Path.home()
 icon_path = Path(home, ".local/share/icons/hicolor/48x48/apps")
 
+SEPARATOR = dict(
+    text = '|',
+    font = "Ubuntu Mono",
+    background="#44475a",
+    foreground = "#000000",
+    padding = 2,
+    fontsize = 14
+)
+
+# Widgets of the bars. Shared widgets are polled once and mirrored on every screen
+BAR_SPEC = [
+    WidgetSpec(widget.CurrentLayoutIcon),
+    WidgetSpec(widget.GroupBox, dict(
+        highlight_method="line",
+        this_current_screen_border="#ff5555",
+        this_screen_border="#50fa7b",
+        other_current_screen_border="#f1fa8c",
+        other_screen_border="#44475a",
+    )),
+    WidgetSpec(widget.WindowName),
+    WidgetSpec(widget.LaunchBar, dict(
+        progs=[(f"{icon_path}/yandex_music.png","chromium --profile-directory='Profile 1' --app='https://yandex.ru/music'", "Yandex Music")]
+    )),
+    WidgetSpec(widget.Sep, dict(
+        linewidth=5,
+        foreground = "#000000",
+    )),
+    WidgetSpec(widget.Battery, dict(
+        background="#44475a",
+        format='{char} {percent:2.0%}',
+        charge_char='',
+        discharge_char='',
+        empty_char='',
+        low_percentage=0.2,
+    ), shared=True),
+    WidgetSpec(widget.TextBox, SEPARATOR),
+    WidgetSpec(widget.Backlight, dict(
+        background="#44475a",
+        backlight_name='intel_backlight',
+        format=' {percent:2.0%}',
+        change_command=None,
+    ), screens="primary", shared=True),
+    WidgetSpec(widget.TextBox, SEPARATOR, screens="primary"),
+    WidgetSpec(SystemKeyboardLayout, dict(
+        background="#44475a",
+        display_map={'us': 'EN', 'ru': 'RU'},
+        group_led_bits=[12],
+    ), shared=True),
+    WidgetSpec(widget.TextBox, SEPARATOR),
+    WidgetSpec(widget.Volume, dict(
+        background="#44475a",
+        fmt=' {}',
+        step=5,
+        volume_app="pavucontrol"
+    ), shared=True),
+    WidgetSpec(widget.Sep, dict(
+        linewidth=5,
+        foreground = "#000000",
+    )),
+    WidgetSpec(widget.Systray, screens="primary"),
+    WidgetSpec(widget.Clock, dict(format=DATE_FORMAT), shared=True),
+]
+
+bar_builder = BarBuilder(BAR_SPEC, size=24)
+
 def create_primary_bar():
     """The panel for main monitor."""
 
-    return bar.Bar([
-        widget.CurrentLayoutIcon(),
-        widget.GroupBox(
-            highlight_method="line",
-            this_current_screen_border="#ff5555",
-            this_screen_border="#50fa7b",
-            other_current_screen_border="#f1fa8c",
-            other_screen_border="#44475a",
-        ),
-        widget.WindowName(),
-        widget.LaunchBar(
-            progs=[(f"{icon_path}/yandex_music.png","chromium --profile-directory='Profile 1' --app='https://yandex.ru/music'", "Yandex Music")]
-        ),
-        widget.Sep(
-            linewidth=5,
-            foreground = "#000000",
-        ),
-        widget.Battery(
-            background="#44475a",
-            format='{char} {percent:2.0%}',
-            charge_char='',
-            discharge_char='',
-            empty_char='',
-            low_percentage=0.2,
-        ),
-        widget.TextBox(
-            text = '|',
-            font = "Ubuntu Mono",
-            background="#44475a",
-            foreground = "#000000",
-            padding = 2,
-            fontsize = 14
-        ),
-        widget.Backlight(
-            background="#44475a",
-            backlight_name='intel_backlight',
-            format=' {percent:2.0%}',
-            change_command=None,
-        ),
-        widget.TextBox(
-            text = '|',
-            font = "Ubuntu Mono",
-            background="#44475a",
-            foreground = "#000000",
-            padding = 2,
-            fontsize = 14
-        ),
-        SystemKeyboardLayout(
-            background="#44475a",
-            display_map={'us': 'EN', 'ru': 'RU'},
-            group_led_bits=[12],
-        ),
-        widget.TextBox(
-            text = '|',
-            font = "Ubuntu Mono",
-            background="#44475a",
-            foreground = "#000000",
-            padding = 2,
-            fontsize = 14
-        ),
-        widget.Volume(
-            background="#44475a",
-            fmt=' {}',
-            step=5,
-            volume_app="pavucontrol"
-        ),
-        widget.Sep(
-            linewidth=5,
-            foreground = "#000000",
-        ),
-        widget.Systray(),
-        widget.Clock(format=DATE_FORMAT),
-    ], 24)
+    return bar_builder.build("primary")
 
 def create_secondary_bar():
     """The panel for extra monitor."""
 
-    return bar.Bar([
-        widget.CurrentLayoutIcon(),
-        widget.GroupBox(
-            highlight_method='line',
-            this_current_screen_border='#ff5555',
-            this_screen_border='#50fa7b',
-            other_current_screen_border='#f1fa8c',
-            other_screen_border='#44475a',
-        ),
-        widget.WindowName(),
-        widget.LaunchBar(
-            progs=[(f"{icon_path}/yandex_music.png","chromium --profile-directory='Profile 1' --app='https://yandex.ru/music'", "Yandex Music")]
-        ),
-        widget.Sep(
-            linewidth=5,
-            foreground = "#000000",
-        ),
-        widget.Battery(
-            background="#44475a",
-            format='{char} {percent:2.0%}',
-            charge_char='',
-            discharge_char='',
-            empty_char='',
-            low_percentage=0.2,
-        ),
-        widget.TextBox(
-            text = '|',
-            font = "Ubuntu Mono",
-            background="#44475a",
-            foreground = "#000000",
-            padding = 2,
-            fontsize = 14
-        ),
-        SystemKeyboardLayout(
-            background="#44475a",
-            display_map={'us': 'EN', 'ru': 'RU'},
-            group_led_bits=[12],
-        ),
-        widget.TextBox(
-            text = '|',
-            font = "Ubuntu Mono",
-            background="#44475a",
-            foreground = "#000000",
-            padding = 2,
-            fontsize = 14
-        ),
-        widget.Volume(
-            background="#44475a",
-            fmt=' {}',
-            step=5,
-            volume_app="pavucontrol"
-        ),
-        widget.Sep(
-            linewidth=5,
-            foreground = "#000000",
-        ),
-        widget.Clock(format=DATE_FORMAT),
-    ], 24)
-
-def setup_screens():
-    """Dynamicaly setting up the connected screens."""
+    return bar_builder.build("secondary")
+
+# Screens by (output name, is primary). They are kept between hot-plugs, so
+# unchanged monitors keep their bars and widgets with the cached state.
+_screens = {}
+
+def _bars_alive(screen) -> bool:
+    """
+    qtile finalizes bars of the screens it drops: their widgets are cleared, newer
+    qtile also removes the bars from the screen (screen.top is None).
+    """
+
+    bars = [gap for gap in (screen.top, screen.bottom, screen.left, screen.right) if isinstance(gap, bar.Bar)]
+    # Every screen is created with the top bar
+    return isinstance(screen.top, bar.Bar) and all(gap.widgets for gap in bars)
+
+def setup_screens(reuse=False):
+    """
+    Dynamicaly setting up the connected screens.
+
+    With reuse=True (hot-plug) only the newly connected monitors get new bars,
+    otherwise (config load) all the bars are created from scratch.
+    """
+
+    global _screens
 
+    previous = _screens if reuse else {}
+    # A monitor unplugged and plugged again quickly may have bars finalized by qtile
+    previous = {key: screen for key, screen in previous.items() if _bars_alive(screen)}
+    current = {}
     screens = []
     # Checking connected screens
     try:
-        result = subprocess.run(["xrandr"], capture_output=True, text=True)
-        xrandr_output = result.stdout
-
-        # Checking trully connected monitors
-        monitors = []
-        for line in xrandr_output.split("\n"):
-            if " connected" in line:
-                monitor_name = line.split()[0]
-                monitors.append(monitor_name)
-        
+        # qtile orders screens like Xinerama does: the primary monitor first
+        connected = sorted(monitors.connected_outputs(), key=lambda output: not output.primary)
+
+        if not connected or (connected[0].name, True) not in previous:
+            # Shared widgets live on the primary bar, if it is new all bars are rebuilt
+            previous = {}
+            bar_builder.reset()
+
         # Create screen for each connected monitor
-        for i, _ in enumerate(monitors):
-            if i == 0:
-                screens.append(Screen(
-                    top=create_primary_bar(),
-                ))
-            else:
-                screens.append(Screen(
-                    top=create_secondary_bar(),
-                ))
+        for i, output in enumerate(connected):
+            key = (output.name, i == 0)
+            screen = previous.get(key)
+            if screen is None:
+                if i == 0:
+                    screen = Screen(
+                        top=create_primary_bar(),
+                    )
+                else:
+                    screen = Screen(
+                        top=create_secondary_bar(),
+                    )
+            current[key] = screen
+            screens.append(screen)
     except Exception as e:
         # Fallback: ceate only one screen if something went wrong
-        screens.append(Screen(top=create_primary_bar()))
-    
+        bar_builder.reset()
+        current = {}
+        screens = [Screen(top=create_primary_bar())]
+
+    _screens = current
     return screens
 
+def monitor_layout_command() -> list[str] | None:
+    """xrandr command for the connected monitors, None if the layout is already applied."""
+
+    return monitor_profiles.layout_command(monitors.get_outputs())
+
 def configure_monitors():
     """Setting up monitors by via xrandr."""
 
     try:
-        result = subprocess.run(["xrandr", "--query"], capture_output=True, text=True)
-        lines = result.stdout.split("\n")
-
-        connected = []
-        for line in lines:
-            if " connected" in line:
-                monitor = line.split()[0]
-                connected.append(monitor)
-        if len(connected) == 1:
-            subprocess.run([
-                "xrandr", "--output", connected[0], "--auto", "--primary",
-                "--output", "HDMI-1", "--off",
-                "--output", "HDMI-2", "--off",
-                "--output", "DP-1", "--off"
-            ])
-        elif len(connected) >= 2:
-            laptop = next((m for m in connected if "eDP" in m or "LVSD" in m), connected[0])
-            external = next((m for m in connected if m != laptop), connected[1])
-            subprocess.run([
-                "xrandr",
-                "--output", laptop, "--auto", "--primary", "--pos", "0x0",
-                "--output", external, "--auto", "--right-of", laptop
-            ])
+        command = monitor_layout_command()
+        if command:
+            subprocess.run(command)
+            monitors.invalidate()
     except Exception as e:
         print(f"Error configuring monitors: {e}")
-
-
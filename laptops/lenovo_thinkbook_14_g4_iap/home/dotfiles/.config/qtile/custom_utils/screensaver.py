@@ -0,0 +1,30 @@
+"""
+User idle time and screen saver state from the MIT-SCREEN-SAVER extension.
+
+It is one request to the X server without running any utils, so pollers can
+use it to slow down while the user is away or the screen is locked (light-locker
+activates the screen saver when it locks the session).
+
+"""
+
+import xcffib
+import xcffib.screensaver
+
+
+class ScreenSaverInfo:
+    """Connection to the X server for querying idle time"""
+
+    def __init__(self, display=None):
+        self.conn = xcffib.connect(display=display)
+        self.screensaver = self.conn(xcffib.screensaver.key)
+        self.screensaver.QueryVersion(1, 1).reply()
+        self.root = self.conn.get_setup().roots[self.conn.pref_screen].root
+
+    def query(self) -> tuple[float, bool]:
+        """Returns (seconds since the last user input, is screen saver active)"""
+
+        info = self.screensaver.QueryInfo(self.root).reply()
+        return info.ms_since_user_input / 1000, info.state == xcffib.screensaver.State.On
+
+    def close(self):
+        self.conn.disconnect()
@@ -0,0 +1,205 @@
+"""
+Passwords from the Secret Service (gnome-keyring, KeePassXC...) over D-Bus, the same
+store libsecret and secret-tool use.
+
+Found passwords are kept in memory for ttl seconds, so the keyring is not asked on
+every connection. A rejected password is not looked up again until a new one is
+stored, which replaces the keyring item. A password is stored by attributes, e.g. of
+an RDP host:
+    secret-tool store --label="RDP admin@10.0.0.10" protocol rdp server 10.0.0.10 user admin
+
+A locked collection is unlocked by the keyring's own prompt. Secrets are transferred
+with the "plain" algorithm, the session bus is only for the user.
+
+The bus address can be given explicitly, e.g. of a private bus with a fake secret
+service.
+
+"""
+
+import asyncio
+import logging
+import time
+
+try:
+    from dbus_fast import Message, MessageType, Variant
+    from dbus_fast.aio import MessageBus
+except ImportError:
+    MessageBus = None
+
+logger = logging.getLogger(__name__)
+
+SECRETS_NAME = "org.freedesktop.secrets"
+SECRETS_PATH = "/org/freedesktop/secrets"
+SERVICE_INTERFACE = "org.freedesktop.Secret.Service"
+COLLECTION_INTERFACE = "org.freedesktop.Secret.Collection"
+PROMPT_INTERFACE = "org.freedesktop.Secret.Prompt"
+DEFAULT_COLLECTION = "/org/freedesktop/secrets/aliases/default"
+
+
+class SecretStore:
+    """Looking up and storing passwords with an in-memory cache"""
+
+    def __init__(self, bus_address=None, ttl=600, prompt_timeout=120):
+        self.bus_address = bus_address
+        # Seconds a found password is kept in memory
+        self.ttl = ttl
+        # Seconds to wait for the user to unlock the keyring
+        self.prompt_timeout = prompt_timeout
+        self.bus = None
+        self.session = None
+        # {attributes: (password, expiration time)}
+        self.cache = {}
+        # Attributes of rejected passwords
+        self.rejected = set()
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _key(attributes) -> tuple:
+        return tuple(sorted(attributes.items()))
+
+    async def lookup(self, attributes) -> str | None:
+        """Password by attributes, None if it is not found or the store is not available"""
+
+        key = self._key(attributes)
+        if key in self.rejected:
+            return None
+        password, expiration = self.cache.get(key, (None, 0))
+        if time.monotonic() < expiration:
+            return password
+        self.cache.pop(key, None)
+
+        async with self._lock:
+            try:
+                password = await self._lookup(attributes)
+            except Exception as e:
+                logger.warning(f"Secret Service error: {e}")
+                self.close()
+                return None
+        if password is not None:
+            self.remember(attributes, password)
+        return password
+
+    async def store(self, attributes, label, password) -> bool:
+        """Storing a password in the default collection, replacing the old one"""
+
+        async with self._lock:
+            try:
+                await self._store(attributes, label, password)
+            except Exception as e:
+                logger.warning(f"Secret Service error: {e}")
+                self.close()
+                return False
+        self.rejected.discard(self._key(attributes))
+        self.remember(attributes, password)
+        return True
+
+    def remember(self, attributes, password):
+        self.cache[self._key(attributes)] = (password, time.monotonic() + self.ttl)
+
+    def reject(self, attributes):
+        """Dropping a wrong password, it is not looked up until a new one is stored"""
+
+        key = self._key(attributes)
+        self.cache.pop(key, None)
+        self.rejected.add(key)
+
+    async def _call(self, path, interface, member, signature="", body=()):
+        reply = await self.bus.call(Message(
+            destination=SECRETS_NAME,
+            path=path,
+            interface=interface,
+            member=member,
+            signature=signature,
+            body=list(body),
+        ))
+        if reply.message_type == MessageType.ERROR:
+            raise RuntimeError(f"{reply.error_name}: {reply.body}")
+        return reply.body
+
+    async def _connect(self):
+        if MessageBus is None:
+            raise RuntimeError("dbus_fast is not installed")
+        self.bus = await MessageBus(bus_address=self.bus_address).connect()
+        _, self.session = await self._call(
+            SECRETS_PATH, SERVICE_INTERFACE, "OpenSession", "sv", ("plain", Variant("s", ""))
+        )
+
+    async def _prompt(self, prompt_path):
+        """Showing the keyring's prompt and waiting for the user, "/" is no prompt"""
+
+        if prompt_path == "/":
+            return
+        completed = asyncio.get_running_loop().create_future()
+
+        def on_message(message):
+            if (
+                message.message_type == MessageType.SIGNAL and
+                message.path == prompt_path and
+                message.member == "Completed" and
+                not completed.done()
+            ):
+                completed.set_result(message.body[0])
+
+        match_rule = f"type='signal',interface='{PROMPT_INTERFACE}',path='{prompt_path}'"
+        await self.bus.call(Message(
+            destination="org.freedesktop.DBus",
+            path="/org/freedesktop/DBus",
+            interface="org.freedesktop.DBus",
+            member="AddMatch",
+            signature="s",
+            body=[match_rule],
+        ))
+        self.bus.add_message_handler(on_message)
+        try:
+            await self._call(prompt_path, PROMPT_INTERFACE, "Prompt", "s", ("",))
+            dismissed = await asyncio.wait_for(completed, self.prompt_timeout)
+        finally:
+            self.bus.remove_message_handler(on_message)
+        if dismissed:
+            raise RuntimeError("Unlocking was dismissed")
+
+    async def _unlock(self, paths):
+        if paths:
+            _, prompt_path = await self._call(SECRETS_PATH, SERVICE_INTERFACE, "Unlock", "ao", (paths,))
+            await self._prompt(prompt_path)
+
+    async def _lookup(self, attributes) -> str | None:
+        if self.bus is None:
+            await self._connect()
+        unlocked, locked = await self._call(
+            SECRETS_PATH, SERVICE_INTERFACE, "SearchItems", "a{ss}", (attributes,)
+        )
+        items = unlocked or locked[:1]
+        if not items:
+            return None
+        if not unlocked:
+            await self._unlock(items)
+
+        secrets, = await self._call(
+            SECRETS_PATH, SERVICE_INTERFACE, "GetSecrets", "aoo", (items[:1], self.session)
+        )
+        if not secrets:
+            return None
+        _, _, value, _ = secrets[items[0]]
+        return bytes(value).decode()
+
+    async def _store(self, attributes, label, password):
+        if self.bus is None:
+            await self._connect()
+        properties = {
+            "org.freedesktop.Secret.Item.Label": Variant("s", label),
+            "org.freedesktop.Secret.Item.Attributes": Variant("a{ss}", attributes),
+        }
+        secret = [self.session, b"", password.encode(), "text/plain; charset=utf8"]
+        _, prompt_path = await self._call(
+            DEFAULT_COLLECTION, COLLECTION_INTERFACE, "CreateItem", "a{sv}(oayays)b",
+            (properties, secret, True),
+        )
+        # If the collection is locked, the item is created after unlocking
+        await self._prompt(prompt_path)
+
+    def close(self):
+        if self.bus is not None:
+            self.bus.disconnect()
+            self.bus = None
+            self.session = None
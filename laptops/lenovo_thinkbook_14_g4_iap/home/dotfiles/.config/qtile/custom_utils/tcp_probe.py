@@ -0,0 +1,76 @@
+"""
+Fast TCP probe of RDP hosts.
+
+A host is up if its port accepts a TCP connection within a short timeout, the time
+of the connect is the latency. Many hosts are probed concurrently, so the whole
+list costs about one timeout. The probed address is the one xfreerdp3 connects to: a
+/port: param replaces the port, a host behind an RD gateway (/g:, /gateway:) is not
+reachable directly and is not probed.
+
+"""
+
+import asyncio
+import time
+
+RDP_PORT = 3389
+GATEWAY_PARAMS = ("/g:", "/gateway:")
+
+
+def split_address(address, default_port=RDP_PORT) -> tuple[str, int]:
+    """'host', 'host:port' or '[ipv6]:port' as in xfreerdp3 /v: to (host, port)"""
+
+    if address.startswith("["):
+        host, _, rest = address[1:].partition("]")
+        return host, int(rest[1:]) if rest.startswith(":") else default_port
+    if address.count(":") == 1:
+        host, port = address.split(":")
+        return host, int(port)
+    # A host name or IPv6 address without brackets
+    return address, default_port
+
+
+def probe_address(address, params=()) -> str | None:
+    """Address to probe for xfreerdp3 /v: and params, None if the host is behind a gateway"""
+
+    if any(param.startswith(GATEWAY_PARAMS) for param in params):
+        return None
+    ports = [param.removeprefix("/port:") for param in params if param.startswith("/port:")]
+    if not ports:
+        return address
+    try:
+        host, _ = split_address(address)
+    except ValueError:
+        return address
+    return f"[{host}]:{ports[-1]}" if ":" in host else f"{host}:{ports[-1]}"
+
+
+async def probe(address, timeout=0.5) -> float | None:
+    """TCP connect time in milliseconds or None if the host is down"""
+
+    try:
+        host, port = split_address(address)
+    except ValueError:
+        return None
+
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    latency = (time.perf_counter() - start) * 1000
+    writer.close()
+    return latency
+
+
+async def probe_all(addresses, timeout=0.5, limit=128) -> dict[str, float | None]:
+    """Probing addresses concurrently, at most limit connections at once"""
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(address):
+        async with semaphore:
+            return await probe(address, timeout)
+
+    addresses = list(dict.fromkeys(addresses))
+    latencies = await asyncio.gather(*(limited(address) for address in addresses))
+    return dict(zip(addresses, latencies))
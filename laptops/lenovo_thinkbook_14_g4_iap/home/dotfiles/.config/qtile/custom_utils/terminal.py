@@ -0,0 +1,38 @@
+"""
+Terminal lookup cached on disk.
+
+guess_terminal() checks a dozen terminals against PATH on every config load. The found
+terminal is saved to ~/.cache/qtile/terminal with its path and is used while the
+executable exists, so a reload costs one stat() instead.
+
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+from libqtile.log_utils import logger
+from libqtile.utils import guess_terminal
+
+CACHE_FILE = Path(os.environ.get("XDG_CACHE_HOME", Path(Path.home(), ".cache")), "qtile/terminal")
+
+
+def cached_terminal(cache_file=CACHE_FILE) -> str | None:
+    """Terminal name, PATH is scanned only if the cached one was removed"""
+
+    try:
+        name, path = cache_file.read_text().split("\n")[:2]
+        if os.access(path, os.X_OK):
+            return name
+    except (OSError, ValueError):
+        pass
+
+    terminal = guess_terminal()
+    path = shutil.which(terminal) if terminal else None
+    if path:
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            cache_file.write_text(f"{terminal}\n{path}\n")
+        except OSError as e:
+            logger.warning(f"Caching terminal error: {e}")
+    return terminal
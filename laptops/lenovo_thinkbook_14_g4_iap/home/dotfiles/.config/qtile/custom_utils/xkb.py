@@ -0,0 +1,134 @@
+"""
+Minimal XKB client based on xcffib (it is installed together with qtile).
+
+It opens its own connection to the X server, subscribes to XKB state events and
+reads the current group and LED indicators directly from the server, so there is
+no need to run xset and parse its output. Only group changes of the keyboard state
+are selected, so pressing modifiers and mouse buttons does not wake the client, and
+the group is taken from the event itself. Root window properties are not selected
+either (_NET_ACTIVE_WINDOW changes on every focus switch), a new keymap is noticed
+by XKB NewKeyboardNotify/MapNotify.
+
+If the server does not support XKB, XkbUnavailable is raised and the caller
+should fallback to the xset/setxkbmap utils.
+
+"""
+
+import xcffib
+import xcffib.xkb
+import xcffib.xproto
+
+# xkbType field of XKB events (see XKBproto.h). All XKB events share one
+# event code, so the real type can be detected only by this field.
+NEW_KEYBOARD_NOTIFY = 0
+MAP_NOTIFY = 1
+STATE_NOTIFY = 2
+INDICATOR_STATE_NOTIFY = 4
+
+STATE_EVENTS = {STATE_NOTIFY, INDICATOR_STATE_NOTIFY}
+LAYOUT_EVENTS = {NEW_KEYBOARD_NOTIFY, MAP_NOTIFY}
+
+
+class XkbUnavailable(Exception):
+    """The X server has no XKB extension or it cannot be used."""
+
+
+class XkbConnection:
+    """Connection to the X server with selected XKB events"""
+
+    device = xcffib.xkb.ID.UseCoreKbd
+    events = (
+        xcffib.xkb.EventType.NewKeyboardNotify
+        | xcffib.xkb.EventType.MapNotify
+        | xcffib.xkb.EventType.StateNotify
+        | xcffib.xkb.EventType.IndicatorStateNotify
+    )
+    state_details = xcffib.xkb.StatePart.GroupState | xcffib.xkb.StatePart.GroupLock
+
+    def __init__(self, display=None):
+        try:
+            self.conn = xcffib.connect(display=display)
+        except xcffib.ConnectionException as e:
+            raise XkbUnavailable(f"Cannot connect to X server: {e}")
+
+        try:
+            self.xkb = self.conn(xcffib.xkb.key)
+            reply = self.xkb.UseExtension(1, 0).reply()
+        except Exception as e:
+            self.conn.disconnect()
+            raise XkbUnavailable(f"XKB extension is not available: {e}")
+
+        if not reply.supported:
+            self.conn.disconnect()
+            raise XkbUnavailable("XKB extension version 1.0 is not supported")
+
+        # All details of the events except StateNotify, it is selected only for groups
+        self.xkb.SelectEvents(
+            self.device, self.events, 0, self.events & ~xcffib.xkb.EventType.StateNotify, 0, 0,
+            [self.state_details, self.state_details],
+        )
+        # The last known group, it is updated by StateNotify events
+        self.group = None
+
+        self.root = self.conn.get_setup().roots[self.conn.pref_screen].root
+        name = "_XKB_RULES_NAMES"
+        self.rules_names_atom = self.conn.core.InternAtom(False, len(name), name).reply().atom
+        self.conn.flush()
+
+    def fileno(self) -> int:
+        """File descriptor for adding to an event loop"""
+
+        return self.conn.get_file_descriptor()
+
+    def get_group(self) -> int:
+        """Getting current keyboard group (layout index)"""
+
+        self.group = self.xkb.GetState(self.device).reply().group
+        return self.group
+
+    def get_indicators(self) -> int:
+        """Getting current LED indicators mask"""
+
+        return self.xkb.GetIndicatorState(self.device).reply().state
+
+    def get_rules_names(self) -> dict[str, str]:
+        """
+        Getting _XKB_RULES_NAMES property, the same values are shown by 'setxkbmap -query'
+
+        Example: {"rules": "evdev", "model": "pc105", "layout": "us,ru", "variant": ",", "options": "grp:win_space_toggle"}
+        """
+
+        reply = self.conn.core.GetProperty(
+            False, self.root, self.rules_names_atom, xcffib.xproto.Atom.STRING, 0, 1024
+        ).reply()
+        values = reply.value.to_string().split("\0")
+        keys = ("rules", "model", "layout", "variant", "options")
+        return {key: value for key, value in zip(keys, values)}
+
+    @staticmethod
+    def _state_notify(event) -> xcffib.xkb.StateNotifyEvent:
+        # All XKB events have one event code, so xcffib parses them as NewKeyboardNotify
+        return xcffib.xkb.StateNotifyEvent(xcffib.CffiUnpacker(event.unpacker.cdata))
+
+    def pending_events(self) -> set[int]:
+        """
+        Reading all queued events, returns set of their xkbType.
+        The group of the last StateNotify is saved in self.group.
+        """
+
+        types = set()
+        while True:
+            event = self.conn.poll_for_event()
+            if not event:
+                break
+            xkb_type = getattr(event, "xkbType", None)
+            if xkb_type is not None:
+                types.add(xkb_type)
+            if xkb_type == STATE_NOTIFY:
+                self.group = self._state_notify(event).group
+        return types
+
+    def close(self):
+        """Closing connection"""
+
+        self.conn.disconnect()
@@ -0,0 +1,31 @@
+"""
+Parsers for 'xset -q' and 'setxkbmap -query' outputs.
+
+They work directly with bytes returned by subprocess: one precompiled regex search
+over the whole buffer, without decoding and splitting it into lines.
+Used by SystemKeyboardLayout widget and scripts/get_led_mask.py.
+
+"""
+
+import re
+
+LED_MASK_RE = re.compile(rb"LED mask:\s*([0-9a-fA-F]+)")
+LAYOUT_RE = re.compile(rb"^layout:\s*(\S+)", re.MULTILINE)
+
+
+def parse_led_mask(output: bytes) -> int | None:
+    """Getting LED mask from 'xset -q' output"""
+
+    match = LED_MASK_RE.search(output)
+    if match is None:
+        return None
+    return int(match.group(1), 16)
+
+
+def parse_layouts(output: bytes) -> list[str] | None:
+    """Getting list of layouts from 'setxkbmap -query' output"""
+
+    match = LAYOUT_RE.search(output)
+    if match is None:
+        return None
+    return match.group(1).decode().split(",")
@@ -0,0 +1,35 @@
+"""
+Mixins for custom text widgets.
+
+RenderDiffMixin counts updates of the text: qtile's _TextBox.update() already skips
+the layout and the draw (and so picom's damage of the bar) when the text is the
+same, the mixin only shows how many redraws were done and avoided by the
+'render_stats' command, e.g.:
+
+    qtile cmd-obj -o widget systemkeyboardlayout -f render_stats
+
+"""
+
+from libqtile.command.base import expose_command
+
+
+class RenderDiffMixin:
+    """Put it before the base widget class: class MyWidget(RenderDiffMixin, base.InLoopPollText)"""
+
+    redraws = 0
+    redraws_avoided = 0
+
+    def update(self, text):
+        # Updates of a finalized widget are dropped by the base class
+        if self.can_draw():
+            if text == self.text:
+                self.redraws_avoided += 1
+            else:
+                self.redraws += 1
+        super().update(text)
+
+    @expose_command()
+    def render_stats(self):
+        """Number of redraws and redraws avoided because the text was the same"""
+
+        return {"redraws": self.redraws, "redraws_avoided": self.redraws_avoided}